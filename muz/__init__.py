@@ -0,0 +1 @@
+"""CSV 典藏資料瀏覽器的資料層（供 streamlit_app.py 與離線工具共用，不依賴 Streamlit）。"""
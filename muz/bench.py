@@ -0,0 +1,257 @@
+"""效能基準：不開 Streamlit，直接跑 App 會發出的查詢路徑，量各階段延遲百分位與峰值 RSS。
+
+用法：
+    python -m muz.bench                         # 同層隨附 CSV
+    python -m muz.bench --sizes 100k,1m,10m     # 另產生同欄位配置的合成典藏（含中文與圖片網址）
+    python -m muz.bench --only d22 --repeat 20 --json bench.json
+
+階段（與 streamlit_app.py 相同的函式 / SQL）：
+    ingest_cold / ingest_warm   CSV → Parquet 匯入（冷：先清掉該來源快取）
+    index_build / sk_build      搜尋索引、sk 彙總附屬檔（冷建置）
+    count                       未篩選 / ILIKE 篩選計數
+    page_first / page_last      keyset 分頁（含頁邊界）；page_last_offset 為舊 OFFSET 做法對照
+    search_index / search_ilike 索引搜尋（命中清單 + 第一頁）與舊 ILIKE 計數 + 第一頁對照
+    sk_agg                      sk 組合 / 連線 / 標籤
+    sankey_reduce               Sankey 縮減圖（每層前 N 名 + 其他）
+    export_csv / export_parquet 完整結果匯出
+
+基準測試使用自己的快取根目錄（MUZ_BENCH_DIR，預設 暫存區/muz_bench；快取在其下的 cache/），
+冷匯入前清快取不會動到 App 正在使用的 MUZ_CACHE_DIR。
+
+每個來源在獨立子行程（python -m muz.bench --worker <path>）中量測，峰值 RSS 只反映該來源；
+--in-process 則全部在同一個行程跑，此時只記錄整個行程最後的峰值 RSS 一次。
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# 必須在匯入 muz 其他模組之前設定：各 DiskLRU 在模組載入時就決定目錄
+BENCH_DIR = os.environ.get("MUZ_BENCH_DIR", os.path.join(tempfile.gettempdir(), "muz_bench"))
+os.environ["MUZ_CACHE_DIR"] = os.path.join(BENCH_DIR, "cache")
+
+import duckdb  # noqa: E402
+
+from .diskcache import copy_to, sql_literal, write_atomic  # noqa: E402
+from .export import export_query  # noqa: E402
+from .ingest import ROWID, STORE, csv_scan, ingest, source_key  # noqa: E402
+from .queries import count_rows, fetch_page, page_bounds  # noqa: E402
+from .sankey import reduce_graph  # noqa: E402
+from .search import ensure_index, fetch_rows, search  # noqa: E402
+from .sk import combos_source, ensure_sk, sk_combos, sk_labels, sk_links  # noqa: E402
+
+KEYWORDS = ["龍", "山水", "王羲之", "公分"]
+PAGE_SIZE = 100
+SIZES = {"100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+
+ERAS = ["清", "明", "宋", "元", "唐", "漢", "商", "周", "民國"]
+MOTIFS = ["山水", "龍紋", "花鳥", "人物", "蓮瓣", "雲紋", "獸面", "纏枝", "王羲之", "蘭亭"]
+OBJECTS = ["方盒", "壺", "瓶", "硯", "軸", "冊", "扇面", "鼎", "盤", "印"]
+SK1 = ["故", "中", "購", "贈", "南購"]
+SK2 = ["銅", "玉", "瓷", "琺", "文", "織", "雕", "漆", "錢", "畫", "書", "帖", "扇", "絲"]
+SK3 = ["器物", "法帖", "書法", "繪畫", "文具", "錢幣", "織品", "雕刻", "漆器"]
+
+
+def _pick(values: list, salt: int) -> str:
+    """依列號雜湊從 values 挑一個值的 SQL 片段（可重現）。"""
+    arr = "[" + ", ".join(sql_literal(v) for v in values) + "]"
+    return f"list_element({arr}, (hash(i, {salt}) % {len(values)})::INTEGER + 1)"
+
+
+def synth_path(rows: int) -> str:
+    return os.path.join(BENCH_DIR, f"synth_{int(rows)}.csv")
+
+
+def synth_csv(rows: int) -> str:
+    """產生與 d*_s1.csv 同欄位配置的合成典藏 CSV（已存在則沿用）。"""
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    path = synth_path(rows)
+    if os.path.exists(path):
+        return path
+    con = duckdb.connect()
+    try:
+        write_atomic(path, copy_to(con, f"""
+            SELECT
+                {_pick(ERAS, 1)} || ' ' || {_pick(MOTIFS, 2)} || {_pick(OBJECTS, 3)} || ' ' || (i % 7 + 1)::VARCHAR || '件' AS name,
+                {_pick(SK3, 4)} AS category,
+                '高' || round((hash(i, 5) % 5000) / 100.0, 1)::VARCHAR || '公分 寬' || round((hash(i, 6) % 3000) / 100.0, 1)::VARCHAR || '公分' AS size,
+                {_pick(ERAS, 7)} AS era,
+                repeat({_pick(MOTIFS, 8)} || '紋飾，' || {_pick(OBJECTS, 9)} || '形制，', (hash(i, 10) % 12 + 1)::INTEGER) AS "desc",
+                'https://digitalarchive.npm.gov.tw/Collection/Detail/' || i::VARCHAR || '?dep=U' AS url,
+                'https://digitalarchive.npm.gov.tw/Image/GetImage?ImageId=' || (1000000 + i)::VARCHAR || '&randomCode=' || (hash(i, 11) % 100000000)::VARCHAR || '&maxW=200&maxH=200' AS imageUrl_s,
+                'syn' || lpad(i::VARCHAR, 9, '0') AS id,
+                {_pick(SK1, 12)} AS sk1,
+                {_pick(SK2, 13)} AS sk2,
+                {_pick(SK3, 14)} AS sk3
+            FROM range({int(rows)}) t(i)
+            """, "FORMAT CSV, HEADER"))
+    finally:
+        con.close()
+    return path
+
+
+def _drop_cache(path: str):
+    # muz 若在本模組之前已被匯入（例如在 App 行程內呼叫），快取根目錄就不是基準測試自己的，不可清
+    if os.path.commonpath([os.path.abspath(STORE.root), os.path.abspath(BENCH_DIR)]) != os.path.abspath(BENCH_DIR):
+        raise RuntimeError(f"快取目錄 {STORE.root} 不在 {BENCH_DIR} 之下，拒絕清除")
+    key = source_key(path)
+    for p in glob.glob(os.path.join(STORE.root, key + ".*")):
+        os.remove(p)
+
+
+def _timeit(fn, repeat: int) -> list:
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000.0)
+    return out
+
+
+def _pct(samples: list, q: float) -> float:
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(round(q * (len(s) - 1))))]
+
+
+def _peak_rss_mb() -> float:
+    """整個行程生命週期的峰值 RSS（ru_maxrss 只增不減）。"""
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024.0 if sys.platform != "darwin" else kb / (1024.0 * 1024.0)
+
+
+def bench_source(con, path: str, repeat: int, export: bool = True) -> dict:
+    """對單一來源跑完所有階段；回傳 {stage: [毫秒樣本...]}。"""
+    res = {}
+    _drop_cache(path)
+    res["ingest_cold"] = _timeit(lambda: ingest(con, path, csv_scan(path)), 1)
+    ing = ingest(con, path, csv_scan(path))
+    res["ingest_warm"] = _timeit(lambda: ingest(con, path, csv_scan(path)), repeat)
+    res["index_build"] = _timeit(lambda: ensure_index(con, ing), 1)
+    cols = [r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {ing.scan}").fetchall() if r[0] != ROWID]
+    kw_cols = cols[:10]
+    scan = ing.scan
+    sel = ", ".join(f'"{c}"' for c in kw_cols)
+    like = "(" + " OR ".join(f'CAST("{c}" AS TEXT) ILIKE $kw' for c in kw_cols) + ")"
+
+    total = count_rows(con, scan)
+    res["count"] = _timeit(lambda: count_rows(con, scan), repeat)
+    res["count_ilike"] = _timeit(lambda: count_rows(con, scan, like, {"kw": f"%{KEYWORDS[0]}%"}), repeat)
+    bounds = page_bounds(con, scan, "TRUE", {}, PAGE_SIZE, total)
+    last = len(bounds)
+    res["page_first"] = _timeit(lambda: fetch_page(con, scan, sel, "TRUE", {}, bounds, 1, PAGE_SIZE), repeat)
+    res["page_last"] = _timeit(lambda: fetch_page(con, scan, sel, "TRUE", {}, bounds, last, PAGE_SIZE), repeat)
+    res["page_last_offset"] = _timeit(
+        lambda: con.execute(f"SELECT {sel} FROM {scan} LIMIT {PAGE_SIZE} OFFSET {(last - 1) * PAGE_SIZE}").fetchdf(), repeat)
+
+    kws = iter(KEYWORDS * repeat)
+    res["search_index"] = _timeit(lambda: fetch_rows(con, scan, sel, search(con, ing, next(kws), kw_cols)[:PAGE_SIZE]), repeat * len(KEYWORDS))
+    # 對照組：舊做法每次換關鍵字都要 ILIKE 計數 + 取第一頁
+    def _ilike_search(kw):
+        count_rows(con, scan, like, {"kw": f"%{kw}%"})
+        con.execute(f"SELECT {sel} FROM {scan} WHERE {like} LIMIT {PAGE_SIZE}", {"kw": f"%{kw}%"}).fetchdf()
+
+    kws = iter(KEYWORDS * repeat)
+    res["search_ilike"] = _timeit(lambda: _ilike_search(next(kws)), repeat * len(KEYWORDS))
+
+    if all(c in cols for c in ("sk1", "sk2", "sk3")):
+        res["sk_build"] = _timeit(lambda: ensure_sk(con, ing), 1)
+        combos = combos_source(con, ing, scan)
+        def _sk_agg():
+            labels = sk_labels(con, combos)
+            return sk_combos(con, combos, labels), sk_links(con, combos, labels), labels
+
+        res["sk_agg"] = _timeit(_sk_agg, repeat)
+        res["sankey_reduce"] = _timeit(lambda: reduce_graph(con, combos), repeat)
+
+    if export:
+        for fmt, stage in (("CSV", "export_csv"), ("Parquet", "export_parquet")):
+            paths = []
+            res[stage] = _timeit(lambda: paths.append(export_query(con, f"SELECT {sel} FROM {scan}", fmt=fmt)), 1)
+            for p in paths:
+                os.remove(p)
+    res["_rows"] = total
+    return res
+
+
+def _bench_isolated(path: str, repeat: int, export: bool) -> tuple:
+    """在子行程量測單一來源，回傳 (階段樣本, 該子行程的峰值 RSS MB)。"""
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cmd = [sys.executable, "-m", "muz.bench", "--worker", path, "--repeat", str(repeat)]
+    if not export:
+        cmd.append("--no-export")
+    out = subprocess.run(cmd, cwd=here, check=True, capture_output=True, text=True).stdout
+    data = json.loads(out.strip().splitlines()[-1])
+    return data["res"], data["peak_rss_mb"]
+
+
+def _print_stages(name: str, res: dict) -> dict:
+    stages = {}
+    for stage, samples in res.items():
+        stats = {"p50": _pct(samples, 0.5), "p95": _pct(samples, 0.95), "max": max(samples),
+                 "mean": statistics.fmean(samples), "n": len(samples)}
+        stages[stage] = stats
+        print(f"{name[:21]:<22}{stage:<18}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['max']:>10.1f}{stats['n']:>5}")
+    return stages
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="CSV 典藏資料瀏覽器查詢路徑基準測試")
+    ap.add_argument("--sizes", default="", help="合成資料列數，逗號分隔：100k,1m,10m（或任意整數）")
+    ap.add_argument("--only", default="", help="只跑檔名包含此字串的來源")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--no-bundled", action="store_true", help="不跑同層隨附 CSV")
+    ap.add_argument("--no-export", action="store_true")
+    ap.add_argument("--in-process", action="store_true", help="不開子行程（峰值 RSS 只記錄整個行程一次）")
+    ap.add_argument("--json", default="", help="另存 JSON 結果")
+    ap.add_argument("--worker", default="", help=argparse.SUPPRESS)  # 子行程：量測單一來源並輸出 JSON
+    args = ap.parse_args(argv)
+
+    if args.worker:
+        res = bench_source(duckdb.connect(), args.worker, args.repeat, export=not args.no_export)
+        print(json.dumps({"res": res, "peak_rss_mb": _peak_rss_mb()}))
+        return
+
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sources = [] if args.no_bundled else sorted(glob.glob(os.path.join(here, "d*.csv")))
+    synth = [SIZES.get(s.lower()) or int(s) for s in filter(None, args.sizes.split(","))]
+    # 先依 --only 篩選再產生合成資料，不用的大檔不必生成
+    sources += [synth_path(n) for n in synth]
+    if args.only:
+        sources = [s for s in sources if args.only in os.path.basename(s)]
+    for n in synth:
+        if synth_path(n) in sources:
+            synth_csv(n)
+
+    con = duckdb.connect() if args.in_process else None
+    report = {}
+    print(f"{'source':<22}{'stage':<18}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'n':>5}")
+    for path in sources:
+        name = os.path.basename(path)
+        if con is not None:
+            res, peak = bench_source(con, path, args.repeat, export=not args.no_export), None
+        else:
+            res, peak = _bench_isolated(path, args.repeat, export=not args.no_export)
+        rows = res.pop("_rows")
+        report[name] = {"rows": rows, "stages": _print_stages(name, res)}
+        if peak is not None:
+            report[name]["peak_rss_mb"] = peak
+            print(f"{name[:21]:<22}{'rows / peak RSS':<18}{rows:>10,}{peak:>10.1f} MB")
+        else:
+            print(f"{name[:21]:<22}{'rows':<18}{rows:>10,}")
+    if con is not None:
+        report["_process_peak_rss_mb"] = _peak_rss_mb()
+        print(f"{'(process)':<22}{'peak RSS':<18}{'':>10}{_peak_rss_mb():>10.1f} MB")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""行程共用的 DuckDB 連線管理：一個資料庫、一次性 SET 設定、每個 session 各拿一個 cursor。
+
+執行緒數與記憶體上限可用參數或環境變數 MUZ_DUCKDB_THREADS / MUZ_DUCKDB_MEMORY_LIMIT（例如 "1GB"）設定；
+MUZ_DUCKDB_DATABASE 可指定磁碟資料庫路徑（預設 :memory:）。
+
+httpfs 不在啟動時安裝：第一次真的要讀遠端來源時才呼叫 ensure_httpfs()（先 LOAD，找不到才 INSTALL）；
+失敗（例如 INSTALL 時網路中斷）不會永久記住，MUZ_HTTPFS_RETRY_SEC（預設 60 秒）後會再試。
+MUZ_DUCKDB_EXTENSION_DIR 可指定擴充套件目錄；離線主機可在建置時先執行
+    python -m muz.db --install
+把 httpfs 預先裝進該目錄（或隨映像檔附上），執行時只需 LOAD、不連網路。
+"""
+import os
+import sys
+import threading
+import time
+
+import duckdb
+
+EXTENSION_DIR = os.environ.get("MUZ_DUCKDB_EXTENSION_DIR") or None
+HTTPFS_RETRY_SEC = float(os.environ.get("MUZ_HTTPFS_RETRY_SEC", "60"))
+
+# 更穩定的 httpfs 設定（遠端 CSV 讀取優化）；用 GLOBAL 讓之後發出的 cursor 都套用
+HTTP_SETTINGS = [
+    # 設定 User-Agent，避免部分遠端（含 GitHub Raw/CDN）拒絕空 UA
+    "SET GLOBAL http_user_agent='Mozilla/5.0 (Streamlit DuckDB)';",
+    "SET GLOBAL enable_http_metadata_cache=true;",
+    "SET GLOBAL http_keep_alive=true;",
+    "SET GLOBAL http_max_redirects=10;",
+    "SET GLOBAL http_open_timeout=30;",
+    "SET GLOBAL http_reuse_connections=true;",
+]
+
+
+class ConnectionManager:
+    def __init__(self, database=None, threads=None, memory_limit=None, extension_dir=None):
+        t0 = time.perf_counter()
+        self.database = database or os.environ.get("MUZ_DUCKDB_DATABASE", ":memory:")
+        self.threads = threads or os.environ.get("MUZ_DUCKDB_THREADS") or None
+        self.memory_limit = memory_limit or os.environ.get("MUZ_DUCKDB_MEMORY_LIMIT") or None
+        self.extension_dir = extension_dir or EXTENSION_DIR
+        self._con = duckdb.connect(self.database)
+        self._lock = threading.Lock()
+        self._httpfs_lock = threading.Lock()
+        self._httpfs_ok = False
+        self._httpfs_failed_at = None
+        self.httpfs_error = None
+        self.httpfs_ms = None
+        self._setup()
+        self.setup_ms = round((time.perf_counter() - t0) * 1000.0, 2)
+
+    def _setup(self):
+        if self.threads:
+            self._con.execute(f"SET threads={int(self.threads)};")
+        if self.memory_limit:
+            self._con.execute("SET memory_limit=$v;", {"v": str(self.memory_limit)})
+        if self.extension_dir:
+            self._con.execute("SET extension_directory=$v;", {"v": str(self.extension_dir)})
+
+    def ensure_httpfs(self) -> bool:
+        """需要讀遠端來源時才載入 httpfs；成功後整個行程不再重試，失敗則等 HTTPFS_RETRY_SEC 後再試。回傳是否可用。"""
+        if self._httpfs_ok:
+            return True
+        with self._httpfs_lock:
+            if self._httpfs_ok:
+                return True
+            if self._httpfs_failed_at is not None and time.time() - self._httpfs_failed_at < HTTPFS_RETRY_SEC:
+                return False
+            t0 = time.perf_counter()
+            # 在自己的 cursor 上執行：共用的根連線只在 _lock 下用來發 cursor，不能被其他執行緒同時拿來下指令
+            con = self.cursor()
+            try:
+                try:
+                    con.execute("LOAD httpfs;")  # 已預先安裝 / 隨附時不必連網路
+                except Exception:
+                    con.execute("INSTALL httpfs; LOAD httpfs;")
+            except Exception as e:
+                # 離線主機裝不到 httpfs 時仍可讀本地檔；遠端來源改走下載快取或 pandas 後援
+                self.httpfs_error = str(e)
+                self._httpfs_failed_at = time.time()
+            else:
+                for _sql in HTTP_SETTINGS:
+                    try:
+                        con.execute(_sql)
+                    except Exception:
+                        pass
+                self.httpfs_error = None
+                self._httpfs_ok = True
+            finally:
+                con.close()
+            self.httpfs_ms = round((time.perf_counter() - t0) * 1000.0, 2)
+        return self._httpfs_ok
+
+    def cursor(self):
+        """回傳共用資料庫上的新 cursor；每個 session / 執行緒應各用各的，不要跨執行緒共用。"""
+        with self._lock:
+            return self._con.cursor()
+
+
+def install_extensions(extension_dir: str = None) -> str:
+    """把 httpfs 裝進擴充套件目錄（建置映像檔 / 離線部署前執行），回傳安裝路徑。"""
+    con = duckdb.connect()
+    if extension_dir or EXTENSION_DIR:
+        con.execute("SET extension_directory=$v;", {"v": str(extension_dir or EXTENSION_DIR)})
+    con.execute("INSTALL httpfs;")
+    row = con.execute("SELECT install_path FROM duckdb_extensions() WHERE extension_name = 'httpfs'").fetchone()
+    return row[0] if row else ""
+
+
+if __name__ == "__main__":
+    if "--install" in sys.argv[1:]:
+        print(install_extensions())
+    else:
+        print("用法：python -m muz.db --install   # 預先安裝 httpfs 到 MUZ_DUCKDB_EXTENSION_DIR（或 DuckDB 預設目錄）")
@@ -0,0 +1,135 @@
+"""磁碟快取目錄：以檔案存取時間（atime）當作「最近使用」時間，超過容量上限時依 LRU 淘汰。
+
+只主動更新 atime、不動 mtime，因為 mtime 會被當成來源指紋的一部分。
+
+同一個 key 可以有多個檔案（例如 <key>.parquet 與其附屬檔），淘汰時整組一起刪除。
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+# 快取根目錄，可用環境變數 MUZ_CACHE_DIR 覆蓋（Streamlit Cloud 上 /tmp 可寫）
+CACHE_ROOT = os.environ.get("MUZ_CACHE_DIR", os.path.join(tempfile.gettempdir(), "muz_cache"))
+
+
+def sql_literal(s: str) -> str:
+    """把字串轉成 SQL 單引號字面值（檔名含 ' 時也安全）。"""
+    return "'" + str(s).replace("'", "''") + "'"
+
+
+def _tmp_name(final: str) -> str:
+    return f"{final}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def write_atomic(path: str, write) -> str:
+    """write(tmp) 寫到暫存檔，成功後以 os.replace() 原子換成 path；失敗時清掉暫存檔。回傳 path。"""
+    tmp = _tmp_name(path)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path
+
+
+def write_json(path: str, data, **dump_kw) -> str:
+    """以 write_atomic 寫 JSON（UTF-8、不轉義中文）；dump_kw 傳給 json.dump。回傳 path。"""
+    def _write(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, **dump_kw)
+    return write_atomic(path, _write)
+
+
+def copy_to(con, query: str, options: str = "FORMAT PARQUET"):
+    """回傳 write(tmp)：以 DuckDB COPY 把查詢結果寫成檔案（搭配 write_atomic / DiskLRU.build）。"""
+    return lambda tmp: con.execute(f"COPY ({query}) TO {sql_literal(tmp)} ({options})")
+
+
+class DiskLRU:
+    def __init__(self, name: str, max_bytes: int, root: str = None):
+        """root 預設為 CACHE_ROOT/name；需要放在特定目錄（例如 Streamlit 靜態檔目錄）時另外指定。"""
+        self.root = root or os.path.join(CACHE_ROOT, name)
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.root, key + suffix)
+
+    def tmp_path(self, final: str) -> str:
+        """寫入用暫存檔名；完成後以 os.replace() 原子替換成正式檔名。"""
+        return _tmp_name(final)
+
+    def get(self, key: str, suffix: str):
+        """命中則回傳路徑並更新使用時間；未命中回傳 None。"""
+        p = self.path(key, suffix)
+        if not os.path.exists(p):
+            return None
+        try:
+            os.utime(p, ns=(time.time_ns(), os.stat(p).st_mtime_ns))
+        except OSError:
+            pass
+        return p
+
+    def build(self, key: str, suffix: str, write, keep=()) -> str:
+        """建立（或沿用）key 的 suffix 檔（主檔或附屬檔），回傳路徑。
+
+        不存在時在同名鎖內以 write(tmp) 寫入並原子替換，寫完立即依容量上限淘汰（key 與 keep 內的 key 不刪）。
+        """
+        path = self.get(key, suffix)
+        if path:
+            return path
+        with self.key_lock(key + suffix):
+            path = self.get(key, suffix)
+            if path:
+                return path
+            path = write_atomic(self.path(key, suffix), write)
+        self.prune(keep={key, *keep})
+        return path
+
+    def key_lock(self, key: str) -> threading.Lock:
+        """同一個 key 的建置互斥（避免多個 session 同時轉檔）。"""
+        with self._lock:
+            lk = self._key_locks.get(key)
+            if lk is None:
+                lk = self._key_locks[key] = threading.Lock()
+            return lk
+
+    def prune(self, keep=()):
+        """總容量超過上限時，從最久未使用的 key 開始刪除（keep 內的 key 不刪）。"""
+        groups = {}
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+        for fn in names:
+            if fn.endswith(".tmp"):
+                continue
+            p = os.path.join(self.root, fn)
+            try:
+                stt = os.stat(p)
+            except OSError:
+                continue
+            key = fn.split(".", 1)[0]
+            size, used, files = groups.get(key, (0, 0.0, []))
+            files.append(p)
+            groups[key] = (size + stt.st_size, max(used, stt.st_atime), files)
+        total = sum(g[0] for g in groups.values())
+        if total <= self.max_bytes:
+            return
+        with self._lock:
+            for key, (size, _used, files) in sorted(groups.items(), key=lambda kv: kv[1][1]):
+                if total <= self.max_bytes:
+                    break
+                if key in keep:
+                    continue
+                for p in files:
+                    try:
+                        os.remove(p)
+                    except OSError:
+                        pass
+                total -= size
@@ -0,0 +1,70 @@
+"""匯出：DuckDB COPY 直接把查詢結果串流寫進「每次請求各自的」暫存檔，不經過 pandas / 記憶體中的 CSV 字串。
+
+暫存檔放在快取根目錄下的 exports/，每次匯出前順手清掉超過 EXPORT_TTL_SEC 的舊檔，
+多個 session 同時匯出也不會互相覆蓋。
+"""
+import os
+import shutil
+import tempfile
+import time
+
+from .diskcache import CACHE_ROOT, sql_literal
+
+EXPORT_DIR = os.path.join(CACHE_ROOT, "exports")
+EXPORT_TTL_SEC = int(os.environ.get("MUZ_EXPORT_TTL_SEC", "900"))
+
+# 顯示名稱 -> (副檔名, MIME, COPY 選項)
+FORMATS = {
+    "CSV": (".csv", "text/csv", "(FORMAT CSV, HEADER)"),
+    "CSV（gzip）": (".csv.gz", "application/gzip", "(FORMAT CSV, HEADER, COMPRESSION GZIP)"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet", "(FORMAT PARQUET, COMPRESSION ZSTD)"),
+}
+UTF8_BOM = b"\xef\xbb\xbf"
+
+
+def sweep(max_age: float = None):
+    """刪除逾時的匯出暫存檔。"""
+    max_age = EXPORT_TTL_SEC if max_age is None else max_age
+    now = time.time()
+    try:
+        names = os.listdir(EXPORT_DIR)
+    except OSError:
+        return
+    for fn in names:
+        p = os.path.join(EXPORT_DIR, fn)
+        try:
+            if now - os.path.getmtime(p) > max_age:
+                os.remove(p)
+        except OSError:
+            pass
+
+
+def export_query(con, sql: str, params=None, fmt: str = "CSV", bom: bool = False) -> str:
+    """把 sql 的結果寫成 fmt 格式的暫存檔並回傳路徑；bom=True 時在未壓縮 CSV 前加 UTF-8 BOM（Excel 友善）。"""
+    ext, _mime, opts = FORMATS[fmt]
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    sweep()
+    fd, path = tempfile.mkstemp(prefix="export_", suffix=ext, dir=EXPORT_DIR)
+    os.close(fd)
+    try:
+        con.execute(f"COPY ({sql}) TO {sql_literal(path)} {opts}", params or {})
+        if bom and ext == ".csv":
+            fd, with_bom = tempfile.mkstemp(prefix="export_", suffix=ext, dir=EXPORT_DIR)
+            with os.fdopen(fd, "wb") as dst, open(path, "rb") as src:
+                dst.write(UTF8_BOM)
+                shutil.copyfileobj(src, dst, 1 << 20)
+            os.remove(path)
+            path = with_bom
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return path
+
+
+def mime_of(fmt: str) -> str:
+    return FORMATS[fmt][1]
+
+
+def ext_of(fmt: str) -> str:
+    return FORMATS[fmt][0]
@@ -0,0 +1,94 @@
+"""分面篩選：category / era / sk1 / sk2 / sk3 的各值筆數，從每個來源預先彙總的小表算出，不掃原始資料。
+
+<key>.facets.parquet 每列是一個分面值組合 (category, era, sk1, sk2, sk3, count, first_row)（缺值為「（缺值）」）；
+- 未輸入關鍵字時，分面筆數、篩選後總筆數、Sankey 的 sk 組合都只查這張小表
+- 有關鍵字時先以同樣的 GROUP BY 彙總命中的列（索引命中時只讀命中的 __rowid），再套用同一套計算
+- 每個分面的筆數排除「自己」的勾選（其他分面的勾選照套），同一分面內可繼續加選其他值
+所有條件都以字面值內嵌（sql_literal），可直接和既有的 where / params 組合。
+"""
+from .diskcache import copy_to, sql_literal
+from .ingest import ROWID, STORE
+from .sk import MISSING
+
+FACET_CANDIDATES = ["category", "era", "sk1", "sk2", "sk3"]
+FACET_SUFFIX = ".facets.parquet"
+
+
+def facet_cols(columns) -> list:
+    return [c for c in FACET_CANDIDATES if c in columns]
+
+
+def value_sql(col: str) -> str:
+    """原始資料上的分面值（與彙總表一致：轉成文字、缺值補「（缺值）」）。"""
+    return f"coalesce(CAST(\"{col}\" AS VARCHAR), '{MISSING}')"
+
+
+def cube_sql(scan: str, cols: list, has_rowid: bool, where: str = "TRUE") -> str:
+    """分面值組合 + 筆數的彙總 SQL；where 可帶關鍵字條件（只彙總命中的列）。"""
+    sel = ", ".join(f'{value_sql(c)} AS "{c}"' for c in cols)
+    first = f'min("{ROWID}")' if has_rowid else "0"
+    return f"SELECT {sel}, count(*) AS count, {first} AS first_row FROM {scan} WHERE {where} GROUP BY ALL"
+
+
+def ensure_facets(con, ingested, cols: list) -> str:
+    """建立（或沿用）來源的分面彙總附屬檔，回傳路徑。"""
+    return STORE.build(ingested.key, FACET_SUFFIX, copy_to(con, f"{cube_sql(ingested.scan, cols, True)} ORDER BY first_row"))
+
+
+def cube_source(con, ingested, scan: str, cols: list, has_rowid: bool) -> str:
+    """回傳可放進 FROM 的分面彙總表：有匯入快取時讀附屬檔，否則就地彙總原始 scan。"""
+    if ingested is not None:
+        return f"read_parquet({sql_literal(ensure_facets(con, ingested, cols))})"
+    return f"({cube_sql(scan, cols, has_rowid)})"
+
+
+def facet_where(selected: dict, on_scan: bool = False, skip: str = None) -> str:
+    """勾選值組成的條件（未勾選回傳 "TRUE"）；on_scan=True 用於原始資料，否則用於彙總表。"""
+    parts = []
+    for c, values in selected.items():
+        if not values or c == skip:
+            continue
+        expr = value_sql(c) if on_scan else f'"{c}"'
+        parts.append(f"{expr} IN ({', '.join(sql_literal(v) for v in values)})")
+    return " AND ".join(parts) or "TRUE"
+
+
+def facet_counts(con, cube: str, cols: list, selected: dict, kw_cube: str = None, params=None) -> dict:
+    """各分面的 [(值, 筆數)]（筆數由大到小）；kw_cube 為關鍵字命中列的彙總 SQL（有關鍵字時）。"""
+    source = kw_cube or f"SELECT * FROM {cube}"
+    parts = [
+        f'SELECT {i} AS f, "{c}" AS v, sum(count) AS n, min(first_row) AS o FROM cube WHERE {facet_where(selected, skip=c)} GROUP BY 2'
+        for i, c in enumerate(cols)
+    ]
+    rows = con.execute(
+        f"WITH cube AS MATERIALIZED ({source}) {' UNION ALL '.join(parts)} ORDER BY f, n DESC, o",
+        params or {},
+    ).fetchall()
+    out = {c: [] for c in cols}
+    for f, v, n, _ in rows:
+        out[cols[f]].append((v, int(n)))
+    return out
+
+
+def facet_total(con, cube: str, selected: dict) -> int:
+    return int(con.execute(f"SELECT coalesce(sum(count), 0) FROM {cube} WHERE {facet_where(selected)}").fetchone()[0])
+
+
+def facet_combos(cube: str, selected: dict) -> str:
+    """套用勾選後的 sk 組合表（與 sk.combos_source 同欄位），供 Sankey 使用。"""
+    return f"""(
+        SELECT sk1, sk2, sk3, sum(count) AS count, min(first_row) AS first_row
+        FROM {cube} WHERE {facet_where(selected)} GROUP BY ALL
+    )"""
+
+
+def filter_hits(con, scan: str, hits: list, selected: dict) -> list:
+    """關鍵字命中清單只留下符合勾選的 __rowid（維持相關度順序）。"""
+    if not hits:
+        return hits
+    rows = con.execute(
+        f'SELECT "{ROWID}" FROM {scan} WHERE "{ROWID}" IN (SELECT unnest($hits)) AND {facet_where(selected, on_scan=True)}',
+        {"hits": hits},
+    ).fetchall()
+    kept = {r[0] for r in rows}
+    return [h for h in hits if h in kept]
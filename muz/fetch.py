@@ -0,0 +1,122 @@
+"""遠端來源下載層：同一個 URL 只下載一次，存進有容量上限的磁碟快取，之後以 ETag / Last-Modified 條件請求重新驗證。
+
+- 快取檔：<sha1(url)>.body（原始位元組）與 <sha1(url)>.meta.json（etag、last_modified、最後驗證時間）
+- 距上次驗證未滿 MUZ_REMOTE_REVALIDATE_SEC（預設 300 秒）直接用本地檔，不連線
+- 同一個 URL 同時被多個 session 要求時只有一個真的下載，其他人等它完成後共用結果
+- 重新驗證失敗（斷線、逾時）時沿用舊檔；從未下載成功才拋出例外
+- progress(已下載位元組, 總位元組或 None) 可回報下載進度；callback 拋出例外即中止下載
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from .diskcache import DiskLRU, write_atomic, write_json
+
+STORE = DiskLRU("remote", int(os.environ.get("MUZ_REMOTE_CACHE_MB", "512")) * 1024 * 1024)
+REVALIDATE_SEC = int(os.environ.get("MUZ_REMOTE_REVALIDATE_SEC", "300"))
+TIMEOUT_SEC = 30
+USER_AGENT = "Mozilla/5.0 (Streamlit DuckDB)"
+
+
+def _read_meta(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _drive_confirm_url(url: str, html: bytes):
+    """Google Drive 大檔會先回「無法掃描病毒」確認頁；從頁面取出真正的下載網址。"""
+    text = html.decode("utf-8", "replace")
+    m = re.search(r'action="([^"]+)"', text)
+    if m and "download" in m.group(1):
+        action = m.group(1).replace("&amp;", "&")
+        fields = dict(re.findall(r'name="([^"]+)" value="([^"]*)"', text))
+        if fields:
+            return action + ("&" if "?" in action else "?") + urllib.parse.urlencode(fields)
+        return action
+    m = re.search(r'href="(/uc\?export=download[^"]+)"', text)
+    if m:
+        return "https://drive.google.com" + m.group(1).replace("&amp;", "&")
+    if "confirm=" not in url:
+        return url + "&confirm=t"
+    return None
+
+
+def _copy(resp, f, progress=None):
+    if progress is None:
+        shutil.copyfileobj(resp, f, 1 << 20)
+        return
+    length = resp.headers.get("Content-Length")
+    total = int(length) if length and length.isdigit() else None
+    done = 0
+    for chunk in iter(lambda: resp.read(1 << 20), b""):
+        f.write(chunk)
+        done += len(chunk)
+        progress(done, total)
+
+
+def _download(url: str, headers: dict, body_path: str, progress=None):
+    """執行（條件）請求；回傳 (status, response headers)。200 時內容已寫入 body_path。"""
+    req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT, **headers})
+    try:
+        resp = urllib.request.urlopen(req, timeout=TIMEOUT_SEC)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return 304, e.headers
+        raise
+    with resp:
+        ctype = resp.headers.get("Content-Type", "")
+        if "google.com" in urllib.parse.urlparse(resp.geturl()).netloc and ctype.startswith("text/html"):
+            nxt = _drive_confirm_url(url, resp.read())
+            if nxt and nxt != url:
+                return _download(nxt, {}, body_path, progress)
+            raise IOError(f"Google Drive 回傳網頁而非檔案：{url}")
+        def _write(tmp):
+            with open(tmp, "wb") as f:
+                _copy(resp, f, progress)
+        write_atomic(body_path, _write)
+        return 200, resp.headers
+
+
+def fetch(url: str, revalidate_after: float = None, progress=None) -> str:
+    """回傳 url 內容在本地快取中的檔案路徑（必要時下載或重新驗證）。"""
+    revalidate_after = REVALIDATE_SEC if revalidate_after is None else revalidate_after
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    body = STORE.path(key, ".body")
+    meta_path = STORE.path(key, ".meta.json")
+    with STORE.key_lock(key):
+        meta = _read_meta(meta_path) if os.path.exists(body) else {}
+        if meta and time.time() - meta.get("checked_at", 0) < revalidate_after:
+            STORE.get(key, ".body")
+            return body
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            status, resp_headers = _download(url, headers, body, progress)
+        except Exception:
+            if meta:
+                return body  # 驗證失敗沿用舊檔
+            raise
+        if status == 200:
+            meta = {
+                "url": url,
+                "etag": resp_headers.get("ETag"),
+                "last_modified": resp_headers.get("Last-Modified"),
+                "fetched_at": time.time(),
+            }
+        meta["checked_at"] = time.time()
+        write_json(meta_path, meta)
+        STORE.get(key, ".body")
+    STORE.prune(keep={key})
+    return body
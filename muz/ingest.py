@@ -0,0 +1,192 @@
+"""資料匯入層：每個來源（本地 CSV 或遠端 URL）只轉檔一次成 Parquet，之後所有查詢都讀快取。
+
+快取 key = 來源 + 內容雜湊 + mtime（本地）或 ETag / Last-Modified（遠端）；
+檔案放在 DiskLRU 目錄，總容量超過 MUZ_INGEST_CACHE_MB（預設 512 MB）時依 LRU 淘汰。
+轉檔時另加一欄連續整數 __rowid（0 起算、依原始列序），作為 keyset 分頁與索引的穩定 key；已發佈的 Parquet 自帶 __rowid 則沿用。
+來源結構（欄位、型別、CSV 格式）另存於 schema 快取，之後讀 CSV 不再取樣偵測。
+"""
+import hashlib
+import os
+import threading
+import time
+import urllib.request
+
+from . import schema as schema_cache
+from .diskcache import DiskLRU, copy_to, sql_literal
+
+# 轉檔格式有變動時遞增，舊快取自然失效
+CACHE_VERSION = 2
+ROWID = "__rowid"
+# 列群組較小，keyset 分頁時可依 __rowid 統計值略過不需要的列群組
+ROW_GROUP_SIZE = 16384
+PARQUET_OPTIONS = f"FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE {ROW_GROUP_SIZE}"
+STORE = DiskLRU("ingest", int(os.environ.get("MUZ_INGEST_CACHE_MB", "512")) * 1024 * 1024)
+
+_hash_memo = {}       # (path, size, mtime_ns) -> sha1
+_validator_memo = {}  # url -> (查詢時間, validator)
+_memo_lock = threading.Lock()
+REMOTE_REVALIDATE_SEC = 60
+
+
+class Ingested:
+    """已轉檔的來源：key 與 Parquet 路徑；scan 為可直接放進 FROM 的 SQL 片段。"""
+
+    def __init__(self, key: str, path: str, hit: bool, schema: dict = None):
+        self.key = key
+        self.path = path
+        self.hit = hit
+        self.schema = schema
+
+    @property
+    def scan(self) -> str:
+        return f"read_parquet({sql_literal(self.path)})"
+
+    def sidecar(self, suffix: str) -> str:
+        """同一來源的附屬檔路徑（例如索引），與主檔同一個 key，LRU 淘汰時一起刪除。"""
+        return STORE.path(self.key, suffix)
+
+
+def csv_scan(path: str) -> str:
+    """與 App 相同的 CSV 讀取片段：已有結構快取時明確指定格式與欄位型別，否則取樣 200000 列偵測。"""
+    try:
+        explicit = schema_cache.read_csv_sql(path, schema_cache.load(source_key(path)))
+    except OSError:
+        explicit = None
+    return explicit or f"read_csv_auto({sql_literal(path)}, SAMPLE_SIZE=200000)"
+
+
+def published_scan(con, src: str):
+    """src 是已發佈的 Parquet（muz.publish 產生、已含 __rowid）時回傳直接查詢的片段，否則 None。
+
+    只讀檔尾中繼資料（遠端經 httpfs 為 HTTP Range 請求）；這類來源不必下載、不必再匯入，
+    分頁 / 計數 / sk 彙總直接依列群組統計值只讀需要的部分。
+    """
+    if not str(src).lower().endswith(".parquet"):
+        return None
+    scan = f"read_parquet({sql_literal(src)})"
+    try:
+        names = [r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {scan}").fetchall()]
+    except Exception:
+        return None
+    return scan if ROWID in names else None
+
+
+def _is_remote(src: str) -> bool:
+    return str(src).lower().startswith(("http://", "https://"))
+
+
+def _file_sha1(path: str) -> str:
+    stt = os.stat(path)
+    memo_key = (path, stt.st_size, stt.st_mtime_ns)
+    with _memo_lock:
+        if memo_key in _hash_memo:
+            return _hash_memo[memo_key]
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _memo_lock:
+        _hash_memo[memo_key] = digest
+    return digest
+
+
+def _remote_validator(url: str):
+    """以 HEAD 取得 ETag / Last-Modified；短時間內重用結果，避免每次 rerun 都連線。
+
+    兩者都沒有時回傳 None（不快取）：只看 Content-Length 的話，內容改了但長度相同會一直用到舊快取。
+    """
+    now = time.time()
+    with _memo_lock:
+        hit = _validator_memo.get(url)
+        if hit and now - hit[0] < REMOTE_REVALIDATE_SEC:
+            return hit[1]
+    req = urllib.request.Request(url, method="HEAD", headers={"User-Agent": "Mozilla/5.0 (Streamlit DuckDB)"})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            h = resp.headers
+            validator = h.get("ETag") or h.get("Last-Modified")
+    except Exception:
+        validator = None
+    with _memo_lock:
+        _validator_memo[url] = (now, validator)
+    return validator
+
+
+def source_key(src: str):
+    """計算來源的快取 key；遠端拿不到任何驗證資訊時回傳 None（不快取）。"""
+    if _is_remote(src):
+        validator = _remote_validator(src)
+        if not validator:
+            return None
+        ident = f"{src}|{validator}"
+    else:
+        stt = os.stat(src)
+        ident = f"{os.path.abspath(src)}|{_file_sha1(src)}|{stt.st_mtime_ns}"
+    return hashlib.sha1(f"v{CACHE_VERSION}|{ident}".encode("utf-8")).hexdigest()
+
+
+def ingest(con, src: str, scan: str):
+    """把 scan（例如 read_csv_auto(...)）的結果轉存成 Parquet；已存在則直接回傳。
+
+    src 用來計算快取 key（本地路徑或 URL）；無法快取時回傳 None，呼叫端應沿用原本的 scan。
+    """
+    key = source_key(src)
+    if key is None:
+        return None
+    path = STORE.get(key, ".parquet")
+    if path:
+        return _with_schema(con, Ingested(key, path, hit=True), src)
+
+    def _write(tmp):
+        # 已發佈的 Parquet 自帶 __rowid（依 sk 排序後的列序），沿用不重編
+        has_rowid = ROWID in [r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {scan}").fetchall()]
+        rowid_sql = "" if has_rowid else f', (row_number() OVER () - 1) AS "{ROWID}"'
+        copy_to(con, f"SELECT *{rowid_sql} FROM {scan}", PARQUET_OPTIONS)(tmp)
+
+    path = STORE.build(key, ".parquet", _write)
+    return _with_schema(con, Ingested(key, path, hit=False), src)
+
+
+def _with_schema(con, ing, src: str = None):
+    """附上來源結構（第一次時偵測並存檔）；src 為本地 CSV 時一併記錄 CSV 格式。"""
+    csv_path = src if src and not _is_remote(src) else None
+    ing.schema = schema_cache.ensure(con, ing.key, ing.scan, csv_path, exclude=(ROWID,))
+    return ing
+
+
+def ingest_union(con, paths: list, source_col: str = "source"):
+    """把多個本地來源合併成一張表（依欄名對齊，缺欄補 NULL），另加 source 欄記錄來自哪個檔案。
+
+    各成員先各自匯入（沿用既有快取），再把成員 Parquet 合併成一份新的快取；
+    key 由成員 key 組成，任何成員內容變動都會重建。__rowid 依成員順序重新編號。
+    """
+    members = [(os.path.splitext(os.path.basename(p))[0], ingest(con, p, csv_scan(p))) for p in paths]
+    members = [(name, ing) for name, ing in members if ing is not None]
+    if not members:
+        return None
+    ident = "|".join(f"{name}={ing.key}" for name, ing in members)
+    key = hashlib.sha1(f"v{CACHE_VERSION}|union|{source_col}|{ident}".encode("utf-8")).hexdigest()
+    path = STORE.get(key, ".parquet")
+    if path:
+        return _with_schema(con, Ingested(key, path, hit=True))
+
+    def _write(tmp):
+        # 欄位順序以欄位最多的成員為準（例如 d0.csv 只有 name/category/id/sk*），其餘欄位依出現順序接在後面
+        schemas = [schema_cache.column_names(ing.schema) for _, ing in members]
+        ordered = []
+        for cols in sorted(schemas, key=len, reverse=True):
+            ordered += [c for c in cols if c not in ordered and c != source_col]
+        select_cols = ", ".join(f'"{c}"' for c in [source_col] + ordered)
+        parts = " UNION ALL BY NAME ".join(
+            f'SELECT {sql_literal(name)} AS "{source_col}", {i} AS __m, * FROM {ing.scan}'
+            for i, (name, ing) in enumerate(members)
+        )
+        copy_to(con, f"""
+            SELECT {select_cols}, (row_number() OVER (ORDER BY __m, "{ROWID}") - 1) AS "{ROWID}"
+            FROM ({parts})
+            ORDER BY __m, "{ROWID}"
+        """, PARQUET_OPTIONS)(tmp)
+
+    path = STORE.build(key, ".parquet", _write, keep={ing.key for _, ing in members})
+    return _with_schema(con, Ingested(key, path, hit=False))
@@ -0,0 +1,135 @@
+"""背景查詢工作：把可能很慢的步驟（遠端下載、匯入、換頁查詢）放到工作執行緒，UI 不必等它完成。
+
+- 每個工作向 ConnectionManager 拿自己的 cursor，cancel() 時以 DuckDB interrupt() 中斷執行中的查詢
+- progress() 綜合兩種來源：工作自己回報的進度（例如下載位元組數）與 DuckDB query_progress()
+- Jobs 是每個 session 一份的登記表：同一個名稱（例如 "source"、"page"）只保留最新的 key，
+  key 變了（換來源 / 換頁）就取消舊工作，避免過時的查詢繼續佔用資源
+- App 每輪最多等 MUZ_JOB_WAIT_SEC（預設 0.5 秒）；還沒完成就先畫進度與上一份結果，每 MUZ_JOB_POLL_SEC 重跑一次查看
+"""
+import os
+import threading
+import time
+
+WAIT_SEC = float(os.environ.get("MUZ_JOB_WAIT_SEC", "0.5"))
+POLL_SEC = float(os.environ.get("MUZ_JOB_POLL_SEC", "0.4"))
+
+
+class Cancelled(Exception):
+    """工作已被取消（換來源 / 換頁）。"""
+
+
+class Job:
+    def __init__(self, db, key, fn, label: str = ""):
+        self.key = key
+        self.label = label
+        self.cursor = db.cursor()
+        try:
+            self.cursor.execute("SET enable_progress_bar=true; SET enable_progress_bar_print=false;")
+        except Exception:
+            pass
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self.logged = False  # App 是否已把這個工作的查詢紀錄併入當輪紀錄
+        self.started_at = time.time()
+        self.finished_at = None
+        self._fraction = None
+        self._text = ""
+        self._done = threading.Event()
+        self._cursor_lock = threading.Lock()  # 工作結束時關閉 cursor；與 interrupt / query_progress 互斥
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, args=(fn,), name=f"muz-job-{label}", daemon=True)
+        self._thread.start()
+
+    def _run(self, fn):
+        try:
+            self.result = fn(self.cursor, self)
+        except Exception as e:
+            self.error = Cancelled() if self.cancelled else e
+        finally:
+            with self._cursor_lock:
+                self._closed = True
+                try:
+                    self.cursor.close()
+                except Exception:
+                    pass
+            self.finished_at = time.time()
+            self._done.set()
+
+    def report(self, fraction=None, text: str = None):
+        """工作端回報進度（0～1，未知為 None）；已取消時拋出 Cancelled 讓工作盡早結束。"""
+        if self.cancelled:
+            raise Cancelled()
+        self._fraction = fraction
+        if text is not None:
+            self._text = text
+
+    def cancel(self):
+        if self._done.is_set():
+            return
+        self.cancelled = True
+        with self._cursor_lock:
+            if self._closed:
+                return
+            try:
+                self.cursor.interrupt()
+            except Exception:
+                pass
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def progress(self):
+        """回傳 (0～1 或 None, 說明文字)。"""
+        frac = self._fraction
+        with self._cursor_lock:
+            try:
+                q = -1 if self._closed else self.cursor.query_progress()
+            except Exception:
+                q = -1
+        if q is not None and q >= 0:
+            frac = max(frac or 0.0, q / 100.0)
+        return frac, self._text
+
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+    def get(self):
+        """取結果；工作失敗時把原本的例外拋出。"""
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class Jobs:
+    """每個 session 的工作登記表（放在 st.session_state）。"""
+
+    def __init__(self, db):
+        self.db = db
+        self._jobs = {}
+
+    def submit(self, name: str, key, fn, label: str = None) -> Job:
+        """回傳 name 對應且 key 相同的工作；key 不同時取消舊工作、啟動新工作。"""
+        job = self._jobs.get(name)
+        if job is not None and job.key == key and not job.cancelled and not (job.done and job.error is not None):
+            return job
+        if job is not None:
+            job.cancel()
+        job = self._jobs[name] = Job(self.db, key, fn, label or name)
+        return job
+
+    def get(self, name: str):
+        return self._jobs.get(name)
+
+    def take(self, name: str):
+        """取走（不再重用）name 對應的工作；下次 submit 一定重新啟動。"""
+        return self._jobs.pop(name, None)
+
+    def cancel(self, name: str):
+        job = self._jobs.pop(name, None)
+        if job is not None:
+            job.cancel()
@@ -0,0 +1,214 @@
+"""查詢計時與結構化日誌：包住 cursor 的 execute()，記錄每個查詢屬於哪個階段、耗時、回傳列數與掃描量。
+
+- 每筆事件同時輸出一行 JSON 到 logger "muz.query"（MUZ_QUERY_LOG=stderr（預設）/ 檔案路徑 / off）
+- profile=True 時開啟 DuckDB JSON profiling，額外取得 rows_scanned / bytes_read / DuckDB 端延遲
+- 快取命中判斷：stage(cached=True) 區塊內若沒有發出任何查詢，就視為命中（例如 st.cache_data 直接回傳）
+"""
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+LOGGER = logging.getLogger("muz.query")
+_configured = False
+_config_lock = threading.Lock()
+
+
+def _configure_logger():
+    global _configured
+    with _config_lock:
+        if _configured:
+            return
+        _configured = True
+        target = os.environ.get("MUZ_QUERY_LOG", "stderr")
+        if target.lower() == "off":
+            LOGGER.disabled = True
+            return
+        handler = logging.StreamHandler() if target.lower() == "stderr" else logging.FileHandler(target, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        LOGGER.addHandler(handler)
+        LOGGER.setLevel(logging.INFO)
+        LOGGER.propagate = False
+
+
+def _compact_sql(sql: str, limit: int = 300) -> str:
+    s = re.sub(r"\s+", " ", sql).strip()
+    return s if len(s) <= limit else s[:limit] + "…"
+
+
+class QueryLog:
+    """一次 rerun 的事件紀錄。"""
+
+    def __init__(self, session: str = None):
+        _configure_logger()
+        self.run_id = uuid.uuid4().hex[:8]
+        self.session = session
+        self.started = time.perf_counter()
+        self.events = []
+        self.current_stage = None
+        self._pending = []
+
+    def emit(self, ev: dict):
+        ev.setdefault("run", self.run_id)
+        if self.session:
+            ev.setdefault("session", self.session)
+        ev.setdefault("t_ms", round((time.perf_counter() - self.started) * 1000.0, 2))
+        LOGGER.info(json.dumps(ev, ensure_ascii=False, default=str))
+
+    def record(self, **ev) -> dict:
+        """新增事件並立即輸出（查詢事件另由 _Result 在取回結果後輸出）。"""
+        self.events.append(ev)
+        self.emit(ev)
+        return ev
+
+    @contextmanager
+    def stage(self, name: str, cached: bool = False):
+        """標記一段階段；區塊內的查詢歸屬此階段，結束時記錄總耗時。
+
+        cached=True 表示區塊是快取包住的呼叫（st.cache_data、已存在的附屬檔），
+        區塊內沒有發出任何查詢即記為命中。
+        """
+        prev = self.current_stage
+        self.current_stage = name
+        n0 = sum(1 for e in self.events if e.get("kind") == "query")
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            n = sum(1 for e in self.events if e.get("kind") == "query") - n0
+            self.current_stage = prev
+            ev = {"kind": "stage", "stage": name, "ms": round((time.perf_counter() - t0) * 1000.0, 2), "queries": n}
+            if cached:
+                ev["cache"] = "hit" if n == 0 else "miss"
+            self.record(**ev)
+
+    def cache(self, name: str, hit):
+        self.record(kind="cache", stage=name, cache=("hit" if hit else "miss"))
+
+    def flush(self):
+        """輸出尚未取回結果的查詢事件（例如 COPY / CREATE VIEW）。"""
+        for ev in self._pending:
+            self.emit(ev)
+        self._pending = []
+
+    def query_events(self) -> list:
+        return [e for e in self.events if e.get("kind") == "query"]
+
+    def stage_events(self) -> list:
+        return [e for e in self.events if e.get("kind") == "stage"]
+
+
+class _Result:
+    """execute() 的回傳值：代理原本的 cursor，在 fetch* 時補上列數與取回時間。"""
+
+    def __init__(self, cursor, ev: dict, owner):
+        self._cursor = cursor
+        self._ev = ev
+        self._owner = owner
+
+    def _finish(self, t0: float, rows):
+        ev = self._ev
+        ev["fetch_ms"] = round((time.perf_counter() - t0) * 1000.0, 2)
+        ev["rows"] = rows
+        self._owner._read_profile(ev)
+        log = self._owner.log
+        if ev in log._pending:
+            log._pending.remove(ev)
+            log.emit(ev)
+
+    def fetchdf(self, *a, **kw):
+        t0 = time.perf_counter()
+        df = self._cursor.fetchdf(*a, **kw)
+        self._finish(t0, len(df))
+        return df
+
+    df = fetch_df = fetchdf
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._finish(t0, len(rows))
+        return rows
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._finish(t0, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=1):
+        t0 = time.perf_counter()
+        rows = self._cursor.fetchmany(size)
+        self._finish(t0, len(rows))
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class ProfiledCursor:
+    """包住 DuckDB cursor：execute() 計時並記錄到 QueryLog，其餘屬性原樣轉給底層 cursor。"""
+
+    def __init__(self, cursor, log: QueryLog, profile: bool = False):
+        self._cursor = cursor
+        self.log = log
+        self.profile_path = None
+        if profile:
+            fd, self.profile_path = tempfile.mkstemp(prefix="muz_profile_", suffix=".json")
+            os.close(fd)
+            cursor.execute("SET enable_profiling='json';")
+            cursor.execute(f"SET profiling_output='{self.profile_path}';")
+
+    def execute(self, sql: str, params=None):
+        t0 = time.perf_counter()
+        ev = {"kind": "query", "stage": self.log.current_stage, "sql": _compact_sql(sql)}
+        try:
+            if params is None:
+                self._cursor.execute(sql)
+            else:
+                self._cursor.execute(sql, params)
+        except Exception as e:
+            ev["error"] = str(e)[:300]
+            ev["exec_ms"] = round((time.perf_counter() - t0) * 1000.0, 2)
+            self.log.record(**ev)
+            raise
+        ev["exec_ms"] = round((time.perf_counter() - t0) * 1000.0, 2)
+        self._read_profile(ev)
+        self.log.events.append(ev)
+        self.log._pending.append(ev)
+        return _Result(self._cursor, ev, self)
+
+    def _read_profile(self, ev: dict):
+        if not self.profile_path:
+            return
+        try:
+            with open(self.profile_path, "r", encoding="utf-8") as f:
+                prof = json.load(f)
+        except (OSError, ValueError):
+            return
+        for src, dst in (("cumulative_rows_scanned", "rows_scanned"), ("total_bytes_read", "bytes_read"),
+                         ("latency", "duckdb_s"), ("rows_returned", "duckdb_rows")):
+            if src in prof:
+                ev[dst] = prof[src]
+
+    def close_profile(self):
+        """停用 profiling 並刪除暫存檔（每次 rerun 結束時呼叫）。"""
+        if self.profile_path:
+            try:
+                self._cursor.execute("SET enable_profiling='no_output';")
+                self._cursor.execute("RESET profiling_output;")
+            except Exception:
+                pass
+            try:
+                os.remove(self.profile_path)
+            except OSError:
+                pass
+            self.profile_path = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
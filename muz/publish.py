@@ -0,0 +1,143 @@
+"""發佈工具：把同層 d*_s1.csv 典藏轉成依 sk1 / sk2 排序的 ZSTD Parquet，另寫 manifest.json。
+
+用法：
+    python -m muz.publish                       # 輸出到同層 parquet/（來源沒變的檔案略過）
+    python -m muz.publish --out dist --force    # 指定輸出目錄、全部重建
+    python -m muz.publish --only d22 --row-group-size 1024
+
+輸出的每個 Parquet：
+- 列依 sk1、sk2（再依原始列序）排序，小列群組（預設 2048 列）各自帶 min / max 統計值，
+  以 sk1 / sk2 篩選時 DuckDB 只需讀統計值相符的列群組
+- 另加 __rowid（0 起算、依排序後的列序），App 直接以它做 keyset 分頁，不必再匯入
+- 放在靜態主機（GitHub Raw）上時，App 經 httpfs 以 HTTP Range 只讀檔尾中繼資料、需要的列群組與欄位
+
+manifest.json 記錄每個檔案的來源雜湊、列數、欄位型別與各列群組的 __rowid / sk1 / sk2 範圍。
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+
+import duckdb
+
+from .diskcache import copy_to, sql_literal, write_atomic, write_json
+from .ingest import ROWID, csv_scan
+
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 1
+SORT_COLS = ["sk1", "sk2"]
+ROW_GROUP_SIZE = 2048
+_SRC_ROW = "__src_row"
+
+
+def _sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(out_dir: str) -> dict:
+    try:
+        with open(os.path.join(out_dir, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _row_group_stats(con, path: str, cols: list) -> list:
+    """各列群組的列數與指定欄位的 min / max（取自 Parquet 檔尾統計值）。"""
+    rows = con.execute(
+        f"""
+        SELECT row_group_id, row_group_num_rows, path_in_schema, stats_min_value, stats_max_value
+        FROM parquet_metadata({sql_literal(path)})
+        WHERE path_in_schema IN (SELECT unnest($cols))
+        ORDER BY row_group_id
+        """,
+        {"cols": cols},
+    ).fetchall()
+    groups = {}
+    for rg, n, col, lo, hi in rows:
+        g = groups.setdefault(rg, {"id": rg, "rows": n})
+        g[col] = [lo, hi]
+    return [groups[k] for k in sorted(groups)]
+
+
+def publish_csv(con, src: str, out_dir: str, row_group_size: int = ROW_GROUP_SIZE) -> dict:
+    """轉檔一個 CSV，回傳其 manifest 項目。"""
+    scan = csv_scan(src)
+    columns = [(r[0], r[1]) for r in con.execute(f"DESCRIBE SELECT * FROM {scan}").fetchall()]
+    names = [c for c, _ in columns]
+    sort_by = [c for c in SORT_COLS if c in names]
+    order = ", ".join([f'"{c}" NULLS LAST' for c in sort_by] + [_SRC_ROW])
+    final = os.path.join(out_dir, os.path.splitext(os.path.basename(src))[0] + ".parquet")
+    write_atomic(final, copy_to(con, f"""
+        SELECT * EXCLUDE ({_SRC_ROW}), (row_number() OVER (ORDER BY {order}) - 1) AS "{ROWID}"
+        FROM (SELECT *, row_number() OVER () AS {_SRC_ROW} FROM {scan})
+        ORDER BY "{ROWID}"
+    """, f"FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE {int(row_group_size)}"))
+    rows = con.execute(f"SELECT count(*) FROM read_parquet({sql_literal(final)})").fetchone()[0]
+    return {
+        "file": os.path.basename(final),
+        "source": os.path.basename(src),
+        "source_sha1": _sha1(src),
+        "sha1": _sha1(final),
+        "bytes": os.path.getsize(final),
+        "rows": rows,
+        "sort_by": sort_by,
+        "columns": [{"name": c, "type": t} for c, t in columns] + [{"name": ROWID, "type": "BIGINT"}],
+        "row_groups": _row_group_stats(con, final, [ROWID] + sort_by),
+    }
+
+
+def publish(sources: list, out_dir: str, row_group_size: int = ROW_GROUP_SIZE, force: bool = False) -> dict:
+    """轉檔所有來源並更新 manifest.json；來源雜湊與列群組設定都沒變的檔案沿用舊結果。"""
+    os.makedirs(out_dir, exist_ok=True)
+    old = load_manifest(out_dir)
+    same_layout = old.get("version") == MANIFEST_VERSION and old.get("row_group_size") == int(row_group_size)
+    files = dict(old.get("files", {})) if same_layout else {}
+    con = duckdb.connect()
+    for src in sources:
+        name = os.path.basename(src)
+        prev = files.get(name)
+        if (not force and prev and prev.get("source_sha1") == _sha1(src)
+                and os.path.exists(os.path.join(out_dir, prev["file"]))):
+            print(f"{name:<22}unchanged")
+            continue
+        t0 = time.perf_counter()
+        files[name] = publish_csv(con, src, out_dir, row_group_size)
+        ent = files[name]
+        print(f"{name:<22}{ent['rows']:>9,} rows{ent['bytes'] / 1e6:>8.2f} MB{len(ent['row_groups']):>5} row groups"
+              f"{(time.perf_counter() - t0) * 1000:>9.0f} ms")
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "row_group_size": int(row_group_size),
+        "rowid": ROWID,
+        "files": files,
+    }
+    write_json(os.path.join(out_dir, MANIFEST), manifest, indent=1, default=str)
+    return manifest
+
+
+def main(argv=None):
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ap = argparse.ArgumentParser(description="把典藏 CSV 發佈成排序、分列群組的 Parquet 與 manifest.json")
+    ap.add_argument("sources", nargs="*", help="CSV 路徑（預設同層 d*_s1.csv）")
+    ap.add_argument("--out", default=os.path.join(here, "parquet"), help="輸出目錄（預設同層 parquet/）")
+    ap.add_argument("--only", default="", help="只轉檔名包含此字串的來源")
+    ap.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    ap.add_argument("--force", action="store_true", help="來源沒變也重建")
+    args = ap.parse_args(argv)
+
+    sources = args.sources or sorted(glob.glob(os.path.join(here, "d*_s1.csv")))
+    if args.only:
+        sources = [s for s in sources if args.only in os.path.basename(s)]
+    publish(sources, args.out, args.row_group_size, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
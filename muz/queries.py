@@ -0,0 +1,43 @@
+"""表格分頁與計數查詢：以 __rowid 做 keyset 分頁，不再用 OFFSET 掃過前面所有列。"""
+from .ingest import ROWID
+
+
+def count_rows(con, scan: str, where: str = "TRUE", params=None) -> int:
+    return con.execute(f"SELECT COUNT(*) FROM {scan} WHERE {where}", params or {}).fetchone()[0]
+
+
+def page_bounds(con, scan: str, where: str, params, page_size: int, total: int = None) -> list:
+    """回傳每一頁第一列的 __rowid（第 p 頁 = bounds[p-1]）。
+
+    未篩選時 __rowid 連續，直接算；有篩選時掃一次取得每 page_size 筆的邊界（呼叫端應快取結果）。
+    """
+    page_size = int(page_size)
+    if where == "TRUE" and total is not None:
+        return list(range(0, max(total, 1), page_size))
+    rows = con.execute(
+        f"""
+        SELECT "{ROWID}" FROM (
+            SELECT "{ROWID}", row_number() OVER (ORDER BY "{ROWID}") - 1 AS rn
+            FROM {scan} WHERE {where}
+        ) WHERE rn % {page_size} = 0
+        ORDER BY 1
+        """,
+        params or {},
+    ).fetchall()
+    return [r[0] for r in rows] or [0]
+
+
+def fetch_page(con, scan: str, select_cols_sql: str, where: str, params, bounds: list, page: int, page_size: int):
+    """依頁邊界 seek 取出第 page 頁（1 起算）：只讀 [bounds[page-1], bounds[page]) 範圍內的列。"""
+    lo = bounds[page - 1]
+    cond = f'"{ROWID}" >= {int(lo)}'
+    if page < len(bounds):
+        cond += f' AND "{ROWID}" < {int(bounds[page])}'
+    q = f"""
+        SELECT {select_cols_sql}
+        FROM {scan}
+        WHERE {cond} AND ({where})
+        ORDER BY "{ROWID}"
+        LIMIT {int(page_size)}
+    """
+    return con.execute(q, params or {}).fetchdf()
@@ -0,0 +1,61 @@
+"""Sankey 縮減：在 DuckDB 內把 sk 組合表縮成瀏覽器畫得動的小圖，再交給 sk_labels / sk_links。
+
+- 每層（sk1、sk2、sk3）節點數超過 top_n 時才縮減：依總權重排序，只保留前 top_n 個、且累積占比達 share 前的節點，
+  其餘併成該層的「其他」節點（排在最後）；節點不多的層原樣保留，小圖不會少掉真實節點
+- 可指定 sk1 聚焦（drill-down）：只取該 sk1 底下的組合再縮減
+- 縮減後仍是 (sk1, sk2, sk3, count, first_row) 的組合表，節點標籤與連線沿用 sk.py 的 ENUM 做法，
+  圖的大小只跟 top_n 有關、與資料列數無關
+"""
+import os
+
+from .diskcache import sql_literal
+from .sk import SK_COLS, sk_labels, sk_links
+
+TOP_N = int(os.environ.get("MUZ_SANKEY_TOP_N", "30"))
+SHARE = float(os.environ.get("MUZ_SANKEY_SHARE", "0.95"))
+OTHER = "其他"
+_LAST = 9223372036854775807  # 「其他」節點的 first_row：排在同層最後
+
+
+def other_label(col: str) -> str:
+    return f"（{OTHER} {col}）"
+
+
+def reduced_combos_sql(combos: str, top_n: int = TOP_N, share: float = SHARE, sk1: str = None) -> str:
+    """回傳縮減後的組合表（可放進 FROM 的子查詢）。"""
+    top_n, share = max(1, int(top_n)), min(max(float(share), 0.0), 1.0)
+    where = f"WHERE sk1 = {sql_literal(sk1)}" if sk1 is not None else ""
+    ctes = [f"c AS (SELECT * FROM {combos} {where})"]
+    for c in SK_COLS:
+        # 該層不超過 top_n 個節點時全部保留；否則累積占比以「排在前面的節點」計算：
+        # 第一個節點一定保留，之後直到前面已達 share 為止
+        ctes.append(f"""
+            w_{c} AS (SELECT {c} AS v, sum(count) AS w, min(first_row) AS o FROM c GROUP BY 1),
+            k_{c} AS (
+                SELECT v, count(*) OVER () <= {top_n} OR (
+                    row_number() OVER (ORDER BY w DESC, o) <= {top_n}
+                    AND coalesce(sum(w) OVER (ORDER BY w DESC, o ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING), 0)
+                        < {share!r} * sum(w) OVER ()
+                ) AS keep
+                FROM w_{c}
+            )""")
+    sel = ", ".join(f"CASE WHEN k_{c}.keep THEN c.{c} ELSE {sql_literal(other_label(c))} END AS {c}" for c in SK_COLS)
+    kept = " AND ".join(f"k_{c}.keep" for c in SK_COLS)
+    joins = " ".join(f"JOIN k_{c} ON c.{c} = k_{c}.v" for c in SK_COLS)
+    return f"""(
+        WITH {", ".join(ctes)}
+        SELECT {sel}, count, CASE WHEN {kept} THEN first_row ELSE {_LAST} END AS first_row
+        FROM c {joins}
+    )"""
+
+
+def reduce_graph(con, combos: str, top_n: int = TOP_N, share: float = SHARE, sk1: str = None):
+    """縮減後的 (連線表, 節點標籤)；連線表欄位與 sk_links 相同（src / dst 為標籤索引）。"""
+    reduced = reduced_combos_sql(combos, top_n, share, sk1)
+    labels = sk_labels(con, reduced)
+    return sk_links(con, reduced, labels), labels
+
+
+def sk1_totals(con, combos: str) -> list:
+    """可聚焦的 sk1 與其總權重（由大到小）。"""
+    return con.execute(f"SELECT sk1, sum(count) AS w FROM {combos} GROUP BY 1 ORDER BY w DESC, min(first_row)").fetchall()
@@ -0,0 +1,128 @@
+"""來源結構快取：每個來源指紋（與匯入快取同一個 key）只偵測一次欄位、型別與 CSV 格式，存成 <key>.schema.json。
+
+- CSV 格式用 DuckDB sniff_csv() 偵測（分隔符、引號、標頭、欄位型別），之後以 read_csv(auto_detect=false, columns=...) 明確讀取
+- 另記錄檔頭是否有 UTF-8 BOM，以及自動辨識的圖片欄 / 連結欄
+- 放在獨立的小型 DiskLRU("schema")，匯入快取被淘汰後重建時也不必重新偵測
+- UI 只要有結構檔就能先畫出欄位選單，不必先掃資料
+"""
+import json
+import os
+
+from .diskcache import DiskLRU, sql_literal, write_json
+
+STORE = DiskLRU("schema", int(os.environ.get("MUZ_SCHEMA_CACHE_MB", "16")) * 1024 * 1024)
+SUFFIX = ".schema.json"
+SAMPLE_SIZE = 200000
+UTF8_BOM = b"\xef\xbb\xbf"
+
+LINK_CANDIDATES = {"url", "link", "api_link", "href"}
+IMAGE_CANDIDATES = {"imageurl", "image_url", "imageurl_s", "thumb", "thumbnail", "img", "image"}
+
+
+def find_col(columns, candidates):
+    """依候選名稱（不分大小寫）找出第一個符合的欄位。"""
+    cands = {c.lower() for c in candidates}
+    for c in columns:
+        if c.lower() in cands:
+            return c
+    return None
+
+
+def load(key: str):
+    """讀取已存的結構；沒有則回傳 None。"""
+    if not key:
+        return None
+    path = STORE.get(key, SUFFIX)
+    if not path:
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save(key: str, schema: dict):
+    write_json(STORE.path(key, SUFFIX), schema)
+    STORE.prune(keep={key})
+
+
+def _has_bom(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(3) == UTF8_BOM
+    except OSError:
+        return False
+
+
+def _is_parquet(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(4) == b"PAR1"
+    except OSError:
+        return False
+
+
+def _sniff_csv(con, path: str) -> dict:
+    row = con.execute(
+        f"SELECT Delimiter, Quote, Escape, NewLineDelimiter, SkipRows, HasHeader, Columns, DateFormat, TimestampFormat "
+        f"FROM sniff_csv({sql_literal(path)}, sample_size={SAMPLE_SIZE})"
+    ).fetchone()
+    delim, quote, escape, new_line, skip, header, columns, date_fmt, ts_fmt = row
+    blank = lambda v: "" if v in (None, "(empty)") else v
+    return {
+        "options": {
+            "delim": blank(delim), "quote": blank(quote), "escape": blank(escape),
+            "new_line": blank(new_line), "skip": int(skip), "header": bool(header),
+            "dateformat": date_fmt, "timestampformat": ts_fmt,
+        },
+        "columns": [{"name": c["name"], "type": c["type"]} for c in columns],
+    }
+
+
+def ensure(con, key: str, scan: str, csv_path: str = None, exclude=()) -> dict:
+    """取得（必要時建立）來源結構；scan 為已匯入的查詢片段，csv_path 為原始 CSV（可偵測格式時提供）。"""
+    schema = load(key)
+    if schema is not None:
+        return schema
+    csv = None
+    if csv_path and os.path.exists(csv_path) and not _is_parquet(csv_path):
+        try:
+            csv = _sniff_csv(con, csv_path)
+        except Exception:
+            csv = None
+    columns = [{"name": r[0], "type": r[1]} for r in con.execute(f"DESCRIBE SELECT * FROM {scan}").fetchall() if r[0] not in exclude]
+    names = [c["name"] for c in columns]
+    schema = {
+        "columns": columns,
+        "csv": csv,
+        "bom": bool(csv_path) and _has_bom(csv_path),
+        "image_col": find_col(names, IMAGE_CANDIDATES),
+        "link_col": find_col(names, LINK_CANDIDATES),
+    }
+    if key:
+        _save(key, schema)
+    return schema
+
+
+def column_names(schema: dict) -> list:
+    return [c["name"] for c in schema["columns"]]
+
+
+def read_csv_sql(path: str, schema: dict) -> str:
+    """以已存結構明確讀取 CSV（不再取樣偵測）；結構沒有 CSV 格式資訊時回傳 None。"""
+    csv = (schema or {}).get("csv")
+    if not csv:
+        return None
+    opts = csv["options"]
+    cols = ", ".join(f"{sql_literal(c['name'])}: {sql_literal(c['type'])}" for c in csv["columns"])
+    args = [
+        sql_literal(path), "auto_detect=false",
+        f"delim={sql_literal(opts['delim'])}", f"quote={sql_literal(opts['quote'])}", f"escape={sql_literal(opts['escape'])}",
+        f"new_line={sql_literal(opts['new_line'])}", f"skip={int(opts['skip'])}", f"header={'true' if opts['header'] else 'false'}",
+        "columns={" + cols + "}",
+    ]
+    for k in ("dateformat", "timestampformat"):
+        if opts.get(k):
+            args.append(f"{k}={sql_literal(opts[k])}")
+    return f"read_csv({', '.join(args)})"
@@ -0,0 +1,139 @@
+"""關鍵字搜尋：匯入時建立「字元 bigram 倒排索引」，搜尋時回傳依相關度排序的 __rowid。
+
+索引存成 <key>.idx.parquet（gram, col, rid, tf），依 gram 排序，查詢時靠列群組統計值只讀命中的片段。
+文字先轉小寫（對應 ILIKE 不分大小寫）；每個位置取 substr(v, i, 2)，最後一個字元會是單字 gram，
+因此單字查詢（例如「龍」）可用 gram 前綴比對，不需另存 unigram。中日韓文字不必斷詞即可命中。
+
+整欄都是 ASCII 的欄位（url、imageUrl_s 這類網址）佔掉大部分 gram 卻很少被搜尋，不建索引，
+只記在 <key>.idx.json；關鍵字含非 ASCII 字元時這些欄位不可能命中，直接略過，否則才對它們做 ILIKE。
+"""
+import json
+import os
+
+from .diskcache import copy_to, sql_literal, write_json
+from .ingest import ROWID, STORE
+
+INDEX_SUFFIX = ".idx.parquet"
+META_SUFFIX = ".idx.json"
+INDEX_ROW_GROUP_SIZE = 65536
+
+
+def _index_path(ingested) -> str:
+    return ingested.sidecar(INDEX_SUFFIX)
+
+
+def _read_meta(ingested) -> dict:
+    with open(ingested.sidecar(META_SUFFIX), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def ensure_index(con, ingested) -> str:
+    """為已匯入的來源建立索引（已存在則略過），回傳索引路徑。"""
+    if has_index(ingested):
+        return _index_path(ingested)
+
+    def _write(tmp):
+        all_cols = [r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {ingested.scan}").fetchall() if r[0] != ROWID]
+        # UTF-8 位元組數 = 字元數 ⇔ 全為 ASCII
+        checks = ", ".join(f'coalesce(bool_and(strlen(CAST("{c}" AS VARCHAR)) = length(CAST("{c}" AS VARCHAR))), true)' for c in all_cols)
+        flags = con.execute(f"SELECT {checks} FROM {ingested.scan}").fetchone() if all_cols else ()
+        ascii_only = [c for c, f in zip(all_cols, flags) if f]
+        cols = [c for c in all_cols if c not in ascii_only]
+        write_json(ingested.sidecar(META_SUFFIX), {"indexed": cols, "ascii_only": ascii_only})
+        parts = [
+            f"""SELECT "{ROWID}" AS rid, {sql_literal(c)} AS col, lower(CAST("{c}" AS VARCHAR)) AS v
+                FROM {ingested.scan} WHERE "{c}" IS NOT NULL"""
+            for c in cols
+        ]
+        if not parts:
+            parts = ["SELECT NULL::BIGINT AS rid, NULL::VARCHAR AS col, NULL::VARCHAR AS v WHERE false"]
+        copy_to(con, f"""
+            WITH t AS ({" UNION ALL ".join(parts)}),
+            g AS (SELECT rid, col, unnest(list_transform(range(1, length(v) + 1), i -> substr(v, i, 2))) AS gram FROM t)
+            SELECT gram, col, rid, count(*)::INTEGER AS tf
+            FROM g GROUP BY gram, col, rid
+            ORDER BY gram, col, rid
+        """, f"FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE {INDEX_ROW_GROUP_SIZE}")(tmp)
+
+    # 索引常比資料本身大好幾倍；build() 寫完會立即檢查容量上限（本來源不淘汰）
+    return STORE.build(ingested.key, INDEX_SUFFIX, _write)
+
+
+def has_index(ingested) -> bool:
+    return ingested is not None and os.path.exists(_index_path(ingested)) and os.path.exists(ingested.sidecar(META_SUFFIX))
+
+
+def _grams(kw: str) -> list:
+    kw = kw.lower()
+    if len(kw) == 1:
+        return [kw]
+    return sorted({kw[i:i + 2] for i in range(len(kw) - 1)})
+
+
+def search(con, ingested, kw: str, kw_cols: list) -> list:
+    """回傳符合 kw 的 __rowid，依相關度（命中欄位數、出現次數）由高到低排序。
+
+    每個欄位需包含關鍵字的所有 gram 才算候選；關鍵字超過兩個字時，
+    再以原本的 ILIKE 條件驗證候選列，排除 gram 都在但不連續的誤判。
+    未建索引的 ASCII 欄位只有在關鍵字本身是 ASCII 時才以 ILIKE 比對。
+    """
+    meta = _read_meta(ingested)
+    idx_cols = [c for c in kw_cols if c in meta["indexed"]]
+    scan_cols = [c for c in kw_cols if c not in meta["indexed"] and (c not in meta["ascii_only"] or kw.isascii())]
+    params = {"kw": f"%{kw}%"}
+    parts = []
+    if idx_cols:
+        grams = _grams(kw)
+        idx = sql_literal(_index_path(ingested))
+        params["cols"] = idx_cols
+        if len(grams) == 1 and len(grams[0]) == 1:
+            gram_cond = "starts_with(gram, $g)"
+            params["g"] = grams[0]
+            n_needed = 1
+        else:
+            gram_cond = "gram IN (SELECT unnest($grams))"
+            params["grams"] = grams
+            n_needed = len(grams)
+        cand = f"""
+            SELECT rid, sum(hit_tf) AS score, count(*) AS n_cols FROM (
+                SELECT rid, col, min(tf) AS hit_tf
+                FROM read_parquet({idx})
+                WHERE {gram_cond} AND col IN (SELECT unnest($cols))
+                GROUP BY rid, col
+                HAVING count(DISTINCT gram) >= {n_needed}
+            ) GROUP BY rid
+        """
+        if len(kw) > 2:
+            like = " OR ".join([f'CAST(s."{c}" AS TEXT) ILIKE $kw' for c in idx_cols])
+            cand = f"""
+                SELECT c.rid, c.score, c.n_cols FROM ({cand}) c
+                JOIN {ingested.scan} s ON s."{ROWID}" = c.rid
+                WHERE {like}
+            """
+        parts.append(cand)
+    if scan_cols:
+        like = " OR ".join([f'CAST("{c}" AS TEXT) ILIKE $kw' for c in scan_cols])
+        parts.append(f'SELECT "{ROWID}" AS rid, 0 AS score, 1 AS n_cols FROM {ingested.scan} WHERE {like}')
+    if not parts:
+        return []
+    if "$kw" not in " ".join(parts):
+        params.pop("kw")
+    q = f"""
+        SELECT rid FROM ({" UNION ALL ".join(parts)})
+        GROUP BY rid
+        ORDER BY sum(n_cols) DESC, sum(score) DESC, rid
+    """
+    return [r[0] for r in con.execute(q, params).fetchall()]
+
+
+def fetch_rows(con, scan: str, select_cols_sql: str, rowids: list):
+    """依給定的 __rowid 順序取出資料列（搜尋結果的一頁）。"""
+    if not rowids:
+        return con.execute(f"SELECT {select_cols_sql} FROM {scan} LIMIT 0").fetchdf()
+    q = f"""
+        SELECT {select_cols_sql}
+        FROM {scan}
+        WHERE "{ROWID}" IN (SELECT unnest($ids))
+        ORDER BY list_position($ids, "{ROWID}")
+    """
+    return con.execute(q, {"ids": [int(r) for r in rowids]}).fetchdf()
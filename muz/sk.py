@@ -0,0 +1,85 @@
+"""sk1 → sk2 → sk3 階層的彙總：全部在 DuckDB 內 GROUP BY，結果存成來源的附屬檔，只算一次。
+
+<key>.sk.parquet 每列是一個唯一組合 (sk1, sk2, sk3, count, first_row)；
+sk 節點表、Sankey 的連線權重與節點標籤都從這張小表推出，不再把整份資料拉進 pandas。
+
+節點標籤清單同時是 sk1～sk3 的字典：查詢時把三欄 CAST 成以標籤為值的 ENUM，
+取回的 DataFrame 直接是 pandas Categorical（int 代碼 + 一份字典），
+Sankey 連線的 source / target 也直接用 enum_code()，不必在 Python 建 label → index 對照。
+"""
+from .diskcache import copy_to, sql_literal
+from .ingest import ROWID, STORE
+
+MISSING = "（缺值）"
+SK_COLS = ["sk1", "sk2", "sk3"]
+SK_SUFFIX = ".sk.parquet"
+
+
+def _combos_sql(scan: str, has_rowid: bool) -> str:
+    sel = ", ".join([f"coalesce(CAST(\"{c}\" AS VARCHAR), '{MISSING}') AS {c}" for c in SK_COLS])
+    first = f'min("{ROWID}")' if has_rowid else "0"
+    return f"""
+        SELECT {sel}, count(*) AS count, {first} AS first_row
+        FROM {scan}
+        GROUP BY ALL
+    """
+
+
+def ensure_sk(con, ingested) -> str:
+    """建立（或沿用）來源的 sk 組合彙總附屬檔，回傳路徑。"""
+    return STORE.build(ingested.key, SK_SUFFIX, copy_to(con, f"{_combos_sql(ingested.scan, True)} ORDER BY first_row"))
+
+
+def combos_source(con, ingested, scan: str) -> str:
+    """回傳可放進 FROM 的組合表：有匯入快取時讀附屬檔，否則就地彙總原始 scan。"""
+    if ingested is not None:
+        return f"read_parquet({sql_literal(ensure_sk(con, ingested))})"
+    return f"({_combos_sql(scan, False)})"
+
+
+def enum_type(labels: list) -> str:
+    """以標籤清單為值的 ENUM 型別（順序即代碼，與 Sankey 節點索引一致）。"""
+    return "ENUM(" + ", ".join(sql_literal(v) for v in (labels or [MISSING])) + ")"
+
+
+def sk_nodes_sql(scan: str, has_id: bool, labels: list) -> str:
+    """原始列（id, sk1, sk2, sk3）；sk 欄以 ENUM 取回（pandas Categorical）。"""
+    enum = enum_type(labels)
+    id_sql = f"coalesce(CAST(\"id\" AS VARCHAR), '{MISSING}') AS \"id\"" if has_id else "'' AS \"id\""
+    sk_sql = ", ".join([f"CAST(coalesce(CAST(\"{c}\" AS VARCHAR), '{MISSING}') AS {enum}) AS \"{c}\"" for c in SK_COLS])
+    return f"SELECT {id_sql}, {sk_sql} FROM {scan}"
+
+
+def sk_combos(con, combos: str, labels: list):
+    """唯一組合 + 計數（sk1, sk2, sk3, count），依計數由大到小；sk 欄為 Categorical。"""
+    enum = enum_type(labels)
+    return con.execute(
+        f"SELECT CAST(sk1 AS {enum}) AS sk1, CAST(sk2 AS {enum}) AS sk2, CAST(sk3 AS {enum}) AS sk3, count "
+        f"FROM {combos} ORDER BY count DESC, first_row"
+    ).fetchdf()
+
+
+def sk_links(con, combos: str, labels: list):
+    """Sankey 連線權重：sk1→sk2 與 sk2→sk3 兩層；src / dst 是 labels 的索引（ENUM 代碼）。"""
+    enum = enum_type(labels)
+    return con.execute(f"""
+        SELECT enum_code(CAST(src AS {enum}))::INTEGER AS src, enum_code(CAST(dst AS {enum}))::INTEGER AS dst, value FROM (
+            SELECT sk1 AS src, sk2 AS dst, sum(count) AS value, 1 AS lvl, min(first_row) AS o FROM {combos} GROUP BY 1, 2
+            UNION ALL
+            SELECT sk2 AS src, sk3 AS dst, sum(count) AS value, 2 AS lvl, min(first_row) AS o FROM {combos} GROUP BY 1, 2
+        ) ORDER BY lvl, o
+    """).fetchdf()
+
+
+def sk_labels(con, combos: str) -> list:
+    """Sankey 節點標籤（也是 sk 欄的 ENUM 字典）：依 sk1、sk2、sk3 的順序與首次出現位置去重（同名節點共用）。"""
+    rows = con.execute(f"""
+        SELECT label FROM (
+            SELECT sk1 AS label, 1 AS lvl, min(first_row) AS o FROM {combos} GROUP BY 1
+            UNION ALL SELECT sk2, 2, min(first_row) FROM {combos} GROUP BY 1
+            UNION ALL SELECT sk3, 3, min(first_row) FROM {combos} GROUP BY 1
+        )
+        QUALIFY row_number() OVER (PARTITION BY label ORDER BY lvl, o) = 1
+        ORDER BY lvl, o
+    """).fetchall()
+    return [r[0] for r in rows]
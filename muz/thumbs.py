@@ -0,0 +1,152 @@
+"""縮圖代理：伺服器端抓取、縮小並快取表格圖片欄的圖片，瀏覽器改從 App 自己的靜態路徑載入縮圖，不再直連典藏圖床。
+
+- 快取檔：<sha1(url)>.jpg（MUZ_THUMB_PX 邊長內的 JPEG），放在有容量上限的 DiskLRU("thumbs")；
+  目錄預設為 App 的 static/thumbs/（需 server.enableStaticServing），瀏覽器以 MUZ_THUMB_URL_PREFIX + 檔名取得
+- 下載用固定大小的執行緒池（MUZ_THUMB_WORKERS，預設 8），同一張圖同時被多個 session 要求時只下載一次
+- serve() 預設不等待（MUZ_THUMB_WAIT_SEC=0）：已快取的圖回縮圖網址，其餘先回原網址並在背景下載，下次 rerun 就改用快取
+- 下載失敗的網址記住 FAIL_TTL_SEC 秒，期間不重試，避免對圖床重複請求
+- MUZ_THUMB_UPSTREAM=http://127.0.0.1:8765 可把圖片網址的 scheme+host 換成本機替身伺服器（測試用）
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from .diskcache import DiskLRU, write_atomic
+
+try:
+    from PIL import Image
+except ImportError:  # 沒有 Pillow 時原圖照存，不縮放
+    Image = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+THUMB_DIR = os.environ.get("MUZ_THUMB_DIR") or os.path.join(STATIC_DIR, "thumbs")
+# 靜態檔網址前綴：Streamlit 把 <App 目錄>/static/ 對應到 app/static/
+URL_PREFIX = os.environ.get("MUZ_THUMB_URL_PREFIX", "app/static/thumbs/")
+STORE = DiskLRU("thumbs", int(os.environ.get("MUZ_THUMB_CACHE_MB", "256")) * 1024 * 1024, root=THUMB_DIR)
+THUMB_PX = int(os.environ.get("MUZ_THUMB_PX", "160"))
+WORKERS = int(os.environ.get("MUZ_THUMB_WORKERS", "8"))
+WAIT_SEC = float(os.environ.get("MUZ_THUMB_WAIT_SEC", "0"))
+UPSTREAM = os.environ.get("MUZ_THUMB_UPSTREAM", "")
+TIMEOUT_SEC = 15
+MAX_BYTES = 10 * 1024 * 1024
+FAIL_TTL_SEC = 600
+PRUNE_EVERY = 64
+SUFFIX = ".jpg"
+USER_AGENT = "Mozilla/5.0 (Streamlit DuckDB)"
+
+_pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="muz-thumb")
+_lock = threading.Lock()
+_inflight = {}  # key -> Future
+_failed = {}    # key -> 失敗時間
+_writes = 0
+
+
+def _key(url: str) -> str:
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+def _upstream_url(url: str) -> str:
+    if not UPSTREAM:
+        return url
+    pr = urllib.parse.urlparse(url)
+    up = urllib.parse.urlparse(UPSTREAM)
+    return urllib.parse.urlunparse((up.scheme, up.netloc, pr.path, pr.params, pr.query, pr.fragment))
+
+
+def _is_image_url(url) -> bool:
+    return isinstance(url, str) and url.lower().startswith(("http://", "https://"))
+
+
+def _resize(raw: bytes) -> bytes:
+    if Image is None:
+        return raw
+    with Image.open(io.BytesIO(raw)) as im:
+        im.thumbnail((THUMB_PX, THUMB_PX))
+        if im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        out = io.BytesIO()
+        im.save(out, format="JPEG", quality=80, optimize=True)
+        return out.getvalue()
+
+
+def _download(url: str, key: str):
+    """下載並縮圖，寫入快取；回傳快取檔路徑，失敗回傳 None。"""
+    global _writes
+    path = STORE.path(key, SUFFIX)
+    try:
+        req = urllib.request.Request(_upstream_url(url), headers={"User-Agent": USER_AGENT})
+        with urllib.request.urlopen(req, timeout=TIMEOUT_SEC) as resp:
+            raw = resp.read(MAX_BYTES + 1)
+        if len(raw) > MAX_BYTES:
+            raise IOError(f"圖片過大：{url}")
+        data = _resize(raw)
+        def _write(tmp):
+            with open(tmp, "wb") as f:
+                f.write(data)
+        write_atomic(path, _write)
+    except Exception:
+        with _lock:
+            _failed[key] = time.time()
+        return None
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+            _writes += 1
+            do_prune = _writes % PRUNE_EVERY == 0
+        if do_prune:
+            STORE.prune()
+    return path
+
+
+def submit(url: str) -> Future:
+    """排入下載（已快取 / 已在下載中則共用同一個 Future）。"""
+    key = _key(url)
+    cached = STORE.get(key, SUFFIX)
+    if cached:
+        fut = Future()
+        fut.set_result(cached)
+        return fut
+    with _lock:
+        failed_at = _failed.get(key)
+        if failed_at is not None and time.time() - failed_at < FAIL_TTL_SEC:
+            fut = Future()
+            fut.set_result(None)
+            return fut
+        fut = _inflight.get(key)
+        if fut is None:
+            fut = _inflight[key] = _pool.submit(_download, url, key)
+        return fut
+
+
+def prefetch(urls):
+    """背景預抓（例如下一頁的圖片），不等待結果。"""
+    for u in dict.fromkeys(urls):
+        if _is_image_url(u):
+            submit(u)
+
+
+def prefetch_later(load_urls) -> Future:
+    """在下載執行緒池裡先呼叫 load_urls() 取得網址（例如查下一頁），再預抓；呼叫端不必等查詢。"""
+    return _pool.submit(lambda: prefetch(load_urls()))
+
+
+def thumb_url(path: str) -> str:
+    return URL_PREFIX + os.path.basename(path)
+
+
+def serve(urls, wait_sec: float = None) -> list:
+    """把圖片網址清單換成快取縮圖的靜態網址（順序不變）；還沒下載好或失敗的保留原網址。"""
+    wait_sec = WAIT_SEC if wait_sec is None else wait_sec
+    futs = {u: submit(u) for u in dict.fromkeys(urls) if _is_image_url(u)}
+    if futs and wait_sec > 0:
+        wait(list(futs.values()), timeout=wait_sec)
+    out = {}
+    for u, fut in futs.items():
+        path = fut.result() if fut.done() else None
+        out[u] = thumb_url(path) if path and os.path.exists(path) else u  # 剛好被淘汰時回原網址
+    return [out.get(u, u) for u in urls]
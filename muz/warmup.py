@@ -0,0 +1,107 @@
+"""啟動預熱：行程啟動時在背景把隨附的 CSV 全部匯入共用資料庫，先建好結構、搜尋索引、sk 彙總與分面彙總。
+
+每個檔案一個工作（執行緒池），各自向 ConnectionManager 拿 cursor；
+完成後在共用資料庫建立同名 view（例如 "d01銅_s1"），並記錄欄位與耗時供 UI 顯示進度。
+build_union=True 時，全部檔案完成後再建好合併表（view "all"）與其索引 / sk / 分面彙總。
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .facets import ensure_facets, facet_cols
+from .ingest import csv_scan, ingest, ingest_union
+from .schema import column_names
+from .search import ensure_index
+from .sk import SK_COLS, ensure_sk
+
+
+def view_name(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class Warmup:
+    def __init__(self, db, paths: list, max_workers: int = None, build_union: bool = False):
+        self.db = db
+        self.paths = list(paths)
+        self.build_union = build_union
+        self.info = {}    # path -> {"columns", "seconds", "key"}
+        self.errors = {}  # path -> 錯誤訊息
+        self.started_at = time.time()
+        self.finished_at = None if self.paths else self.started_at
+        self._finished = 0
+        self._lock = threading.Lock()
+        workers = max_workers or min(4, os.cpu_count() or 1)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="muz-warmup")
+        self._futures = [self._pool.submit(self._warm_one, p) for p in self.paths]
+        self._pool.shutdown(wait=False)
+
+    def _warm_one(self, path: str):
+        t0 = time.time()
+        con = None
+        try:
+            con = self.db.cursor()
+            ing = ingest(con, path, csv_scan(path))
+            self._prepare(con, ing, view_name(path), path, t0)
+        except Exception as e:
+            with self._lock:
+                self.errors[path] = str(e)
+        finally:
+            if con is not None:
+                con.close()
+            with self._lock:
+                self._finished += 1
+                last = self._finished == len(self.paths)
+            if last:
+                if self.build_union:
+                    self._warm_union()
+                self.finished_at = time.time()
+
+    def _prepare(self, con, ing, name: str, label: str, t0: float):
+        cols = column_names(ing.schema)
+        ensure_index(con, ing)
+        if all(c in cols for c in SK_COLS):
+            ensure_sk(con, ing)
+        if facet_cols(cols):
+            ensure_facets(con, ing, facet_cols(cols))
+        con.execute(f'CREATE OR REPLACE VIEW "{name}" AS SELECT * FROM {ing.scan}')
+        with self._lock:
+            self.info[label] = {"columns": cols, "seconds": round(time.time() - t0, 3), "key": ing.key}
+
+    def _warm_union(self):
+        t0 = time.time()
+        con = None
+        try:
+            con = self.db.cursor()
+            ing = ingest_union(con, [p for p in self.paths if p not in self.errors])
+            if ing is not None:
+                self._prepare(con, ing, "all", "all", t0)
+        except Exception as e:
+            with self._lock:
+                self.errors["all"] = str(e)
+        finally:
+            if con is not None:
+                con.close()
+
+    @property
+    def done(self) -> int:
+        with self._lock:
+            return self._finished
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None
+
+    def progress(self) -> float:
+        return self.done / len(self.paths) if self.paths else 1.0
+
+    def wait(self, timeout: float = None) -> bool:
+        """等待全部完成（離線工具 / 測試用）；逾時回傳 False。"""
+        deadline = None if timeout is None else time.time() + timeout
+        for f in self._futures:
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                f.result(timeout=remaining)
+            except Exception:
+                return False
+        return True
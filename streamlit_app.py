@@ -41,10 +41,34 @@ html, body, .stApp { min-height: 100% !important; height: auto !important; overf
 # ===== 主體 =====
 import os
 import math
-import duckdb
-import pandas as pd
+import sys
+import time
+_IMPORT_T0 = time.perf_counter()
+import importlib
+import threading
 from datetime import datetime
 from urllib.parse import urlparse, unquote, urlunparse, quote
+from muz.db import ConnectionManager
+from muz.fetch import fetch
+from muz.export import FORMATS, export_query, ext_of, mime_of
+from muz.facets import FACET_CANDIDATES, cube_source, cube_sql, facet_cols, facet_combos, facet_counts, facet_total, facet_where, filter_hits
+from muz.ingest import ROWID, csv_scan, ingest, ingest_union, published_scan, source_key
+from muz.jobs import POLL_SEC, WAIT_SEC, Jobs
+from muz.profiling import ProfiledCursor, QueryLog
+from muz.schema import IMAGE_CANDIDATES, LINK_CANDIDATES, column_names, find_col
+from muz.schema import load as load_schema
+from muz.queries import count_rows, fetch_page, page_bounds
+from muz.search import ensure_index, fetch_rows, has_index, search
+from muz.sankey import OTHER, SHARE, TOP_N, reduce_graph, sk1_totals
+from muz.sk import combos_source, sk_combos, sk_labels, sk_nodes_sql
+from muz import thumbs
+from muz.warmup import Warmup
+
+# === 冷啟動：pandas（約 0.4 秒）在背景先載入，與資料庫建立 / 來源匯入同時進行；
+# 第一次取回 DataFrame 時多半已載好。Plotly 只在 Sankey 分頁開啟時才匯入，httpfs 等到讀遠端來源才載入 ===
+if "pandas" not in sys.modules:
+    threading.Thread(target=importlib.import_module, args=("pandas",), name="muz-preload", daemon=True).start()
+IMPORT_MS = round((time.perf_counter() - _IMPORT_T0) * 1000.0, 2)
 
 st.title("CSV 典藏資料瀏覽器")
 src_ph = st.empty()
@@ -57,43 +81,94 @@ DEFAULT_CSV_URL = ""  # 空字串 = 預設走本地 d0.csv
 # ✅ 遠端 CSV 基底（用於 ?csv=僅給檔名時的後援解析），可用環境變數 CSV_BASE_URL 覆蓋
 CSV_BASE_URL = os.environ.get("CSV_BASE_URL", "https://raw.githubusercontent.com/muse-101/npm-dataset/main/")
 REMOTE_CSV_BASES = [CSV_BASE_URL]
+# 發佈的 Parquet（python -m muz.publish 產生的 parquet/ 目錄）；?csv=d22帖_s1.parquet 這類檔名從這裡讀
+PARQUET_BASE_URL = os.environ.get("MUZ_PARQUET_BASE_URL", CSV_BASE_URL.rstrip("/") + "/parquet/")
+
+# 本機快速切換：測試檔連結（可自行增修）；同層存在的檔案也會在啟動時預熱
+TEST_FILES = [
+    "d0.csv",
+    "d01銅_s1.csv", "d02玉_s1.csv", "d03瓷_s1.csv", "d04琺_s1.csv", "d05雜_s1.csv",
+    "d06文_s1.csv", "d07織_s1.csv", "d08雕_s1.csv", "d09漆_s1.csv", "d10錢_s1.csv",
+    "d20畫_s1.csv", "d21書_s1.csv", "d22帖_s1.csv", "d23扇_s1.csv", "d24絲_s1.csv"
+]
+BUNDLED_PATHS = [os.path.join(os.path.dirname(__file__), n) for n in TEST_FILES if os.path.exists(os.path.join(os.path.dirname(__file__), n))]
+# ?csv=all（或 *）：把所有同層典藏合併成一張表查詢（多一欄 source 記錄來源檔）
+UNION_PARAMS = ("all", "*")
+
+# === 共用 DuckDB：整個行程只建一次資料庫（httpfs 等到讀遠端來源時才載入），每個 session 各拿一個 cursor ===
+@st.cache_resource
+def _get_db() -> ConnectionManager:
+    return ConnectionManager()
 
-con = duckdb.connect()
-con.execute("INSTALL httpfs; LOAD httpfs;")
-# 設定 User-Agent，避免部分遠端（含 GitHub Raw/CDN）拒絕空 UA
+def _session_cursor():
+    if "duck_cursor" not in st.session_state:
+        st.session_state["duck_cursor"] = _get_db().cursor()
+    return st.session_state["duck_cursor"]
+
+# === 網址參數（?csv= / ?debug= / ?embed=） ===
 try:
-    con.execute("SET http_user_agent='Mozilla/5.0 (Streamlit DuckDB)';")
+    _qp = st.query_params if hasattr(st, "query_params") else st.experimental_get_query_params()
 except Exception:
-    pass
-# 更穩定的 httpfs 設定（遠端 CSV 讀取優化）
-for _sql in [
-    "SET enable_http_metadata_cache=true;",
-    "SET http_keep_alive=true;",
-    "SET http_max_redirects=10;",
-    "SET http_open_timeout=30;",
-    "SET http_reuse_connections=true;",
-]:
-    try:
-        con.execute(_sql)
-    except Exception:
-        pass
+    _qp = {}
+
+def _qp_get(name: str) -> str:
+    v = _qp.get(name, "")
+    if isinstance(v, list):
+        v = v[0] if v else ""
+    return str(v or "")
+
+DEBUG = _qp_get("debug").lower() in ("1", "true", "yes")
+
+# === 查詢計時：每次 rerun 一份紀錄；所有查詢經 ProfiledCursor 計時，?debug=1 時另開 DuckDB profiling 取掃描量 ===
+# 觸發這次 rerun 的來源：比對有 key 的元件與網址參數和上一輪的快照（按鈕被按下時當輪為 True）
+_TRIGGER_KEYS = ["keyword", "main_tab", "show_cols", "kw_cols", "page_size", "page", "sk_view", "sankey_min", "sankey_sk1", "sankey_top_n", "sankey_share", "export_fmt", "csv_url_input"] + [f"facet_{c}" for c in FACET_CANDIDATES]
+_BUTTON_KEYS = ["btn_first", "btn_prev", "btn_next", "btn_last", "btn_load_url", "btn_clear_url", "btn_sk_raw", "btn_export", "btn_cancel_load"]
+
+def _trigger_snapshot() -> dict:
+    snap = {k: st.session_state.get(k) for k in _TRIGGER_KEYS}
+    snap["?csv"] = _qp_get("csv")
+    return snap
+
+def _rerun_trigger() -> str:
+    snap = _trigger_snapshot()
+    prev = st.session_state.get("_trigger_snapshot")
+    pressed = [k for k in _BUTTON_KEYS if st.session_state.get(k) is True]
+    if pressed:
+        return "button:" + ",".join(pressed)
+    if prev is None:
+        return "first_load"
+    changed = [k for k in snap if snap[k] != prev.get(k)]
+    return ("changed:" + ",".join(changed)) if changed else "rerun"
+
+if "muz_session" not in st.session_state:
+    import uuid
+    st.session_state["muz_session"] = uuid.uuid4().hex[:8]
+QLOG = QueryLog(session=st.session_state["muz_session"])
+QLOG.record(kind="rerun", trigger=_rerun_trigger(), csv=_qp_get("csv"))
+QLOG.record(kind="stage", stage="imports", ms=IMPORT_MS, queries=0)
+PROFILE = DEBUG or os.environ.get("MUZ_QUERY_PROFILE") == "1"
+con = ProfiledCursor(_session_cursor(), QLOG, profile=PROFILE)
+
+# === 啟動預熱：行程第一次執行時在背景匯入所有同層測試檔（建索引 / sk 彙總），之後的訪客直接命中快取 ===
+@st.cache_resource
+def _get_warmup() -> Warmup:
+    return Warmup(_get_db(), BUNDLED_PATHS, build_union=True)
+
+WARMUP = _get_warmup()
 
 # —— 左側欄：控制面板（快速連結 + URL 載入 + 欄位/搜尋/頁面大小 + 下載）——
 import urllib.parse as _u
 with st.sidebar:
     st.header("控制面板")
 
-    # 本機快速切換：測試檔連結（可自行增修）
-    TEST_FILES = [
-        "d0.csv",
-        "d01銅_s1.csv", "d02玉_s1.csv", "d03瓷_s1.csv", "d04琺_s1.csv", "d05雜_s1.csv",
-        "d06文_s1.csv", "d07織_s1.csv", "d08雕_s1.csv", "d09漆_s1.csv", "d10錢_s1.csv",
-        "d20畫_s1.csv", "d21書_s1.csv", "d22帖_s1.csv", "d23扇_s1.csv", "d24絲_s1.csv"
-    ]
     def _display_name(fn: str) -> str: return fn[:-4] if fn.lower().endswith(".csv") else fn
-    links = " | ".join([f"[{_display_name(n)}](?csv={_u.quote(n)})" for n in TEST_FILES])
+    links = " | ".join([f"[{_display_name(n)}](?csv={_u.quote(n)})" for n in TEST_FILES] + ["[全部](?csv=all)"])
     st.subheader("切換測試檔")
     st.markdown(links, unsafe_allow_html=True)
+    if not WARMUP.ready:
+        st.progress(WARMUP.progress(), text=f"預熱中：{WARMUP.done} / {len(WARMUP.paths)} 個檔案")
+    else:
+        st.caption(f"✅ 已預熱 {WARMUP.done} 個檔案" + (f"（{len(WARMUP.errors)} 個失敗）" if WARMUP.errors else ""))
     st.markdown("---")
 
     # 直接貼 URL 載入（GitHub Raw / Google Drive uc?export=download / 任意 http/https）
@@ -106,7 +181,7 @@ with st.sidebar:
     )
     col_u1, col_u2 = st.columns([1,1])
     with col_u1:
-        if st.button("載入 URL", type="primary"):
+        if st.button("載入 URL", type="primary", key="btn_load_url"):
             if csv_url.strip():
                 url = csv_url.strip()
                 try:
@@ -115,7 +190,7 @@ with st.sidebar:
                     st.experimental_set_query_params(csv=url)
                 st.rerun()
     with col_u2:
-        if st.button("清除 URL"):
+        if st.button("清除 URL", key="btn_clear_url"):
             try:
                 st.query_params.clear()
             except Exception:
@@ -124,6 +199,8 @@ with st.sidebar:
 
 # === 解析網址參數（?csv= 可為 本地檔名 或 http/https URL） ===
 RESOLVED_URL = None  # 若實際用到遠端網址，記錄在此供後援載入使用
+SCAN_SRC = None      # 原始來源（本地路徑或 URL），用來計算匯入快取 key
+UNION_PATHS = None   # 合併模式時的成員檔案
 
 def _normalize_drive_url(u: str) -> str:
     """將常見的 Google Drive 分享網址轉為可直接下載的 uc?export=download 形式。"""
@@ -184,41 +261,46 @@ def _auto_encode_nonascii_url(u: str) -> str:
     except Exception:
         pass
     return u
-try:
-    _qp = st.query_params if hasattr(st, "query_params") else st.experimental_get_query_params()
-except Exception:
-    _qp = {}
-_csv_param = _qp.get("csv", "")
-if isinstance(_csv_param, list):
-    _csv_param = _csv_param[0] if _csv_param else ""
+_csv_param = _qp_get("csv")
 
 if _csv_param:
-    if str(_csv_param).lower().startswith(("http://", "https://")):
+    if str(_csv_param).lower() in UNION_PARAMS:
+        UNION_PATHS = BUNDLED_PATHS
+        _paths_sql = ", ".join("'" + p_.replace("'", "''") + "'" for p_ in UNION_PATHS)
+        scan = f"read_csv_auto([{_paths_sql}], union_by_name=true, filename=true, SAMPLE_SIZE=200000)"
+        source_hint = f"資料來源（全部典藏合併）：{len(UNION_PATHS)} 個同層檔案"
+    elif str(_csv_param).lower().startswith(("http://", "https://")):
         _url = _auto_encode_nonascii_url(_normalize_drive_url(str(_csv_param)))
         _is_parquet = _url.lower().endswith(".parquet")
         scan = f"parquet_scan('{_url}')" if _is_parquet else f"read_csv_auto('{_url}', SAMPLE_SIZE=200000)"
         source_hint = f"資料來源（URL）：{_url}"
         RESOLVED_URL = _url
+        SCAN_SRC = _url
     else:
         _alt = os.path.join(os.path.dirname(__file__), _csv_param)
+        _is_parquet = _csv_param.lower().endswith(".parquet")
         if os.path.exists(_alt):
-            scan = f"read_csv_auto('{_alt}', SAMPLE_SIZE=200000)"
+            scan = f"parquet_scan('{_alt}')" if _is_parquet else csv_scan(_alt)
             source_hint = f"資料來源（同層檔案）：{_alt}"
+            SCAN_SRC = _alt
         else:
-            # 後援：將 csv 檔名接到遠端基底（例如 GitHub Raw），支援中文檔名
+            # 後援：將 csv 檔名接到遠端基底（例如 GitHub Raw），支援中文檔名；.parquet 接到發佈目錄
             enc = _u.quote(_csv_param)
-            fallback_url = REMOTE_CSV_BASES[0].rstrip('/') + '/' + enc
-            scan = f"read_csv_auto('{fallback_url}', SAMPLE_SIZE=200000)"
+            fallback_url = (PARQUET_BASE_URL if _is_parquet else REMOTE_CSV_BASES[0]).rstrip('/') + '/' + enc
+            scan = f"parquet_scan('{fallback_url}')" if _is_parquet else f"read_csv_auto('{fallback_url}', SAMPLE_SIZE=200000)"
             source_hint = f"資料來源（遠端後援）：{fallback_url}"
+            SCAN_SRC = fallback_url
 else:
     if DEFAULT_CSV_URL:
         _url = _auto_encode_nonascii_url(_normalize_drive_url(DEFAULT_CSV_URL))
         scan = f"read_csv_auto('{_url}', SAMPLE_SIZE=200000)"
         source_hint = f"資料來源（GitHub Raw）：{_url}"
         RESOLVED_URL = _url
+        SCAN_SRC = _url
     else:
-        scan = f"read_csv_auto('{CSV_PATH}', SAMPLE_SIZE=200000)"
+        scan = csv_scan(CSV_PATH)
         source_hint = f"資料來源：{CSV_PATH}"
+        SCAN_SRC = CSV_PATH
 
 # === 下載檔名：muz01_XXXX_OOOO.csv ===
 # XXXX = 原始資料檔名（無副檔名），OOOO = 目前時間戳（YYYYMMDD_HHMMSS）
@@ -233,7 +315,7 @@ def _infer_src_basename(src: str) -> str:
     except Exception:
         return "data"
 
-_src_for_name = _csv_param or (DEFAULT_CSV_URL if DEFAULT_CSV_URL else CSV_PATH)
+_src_for_name = "all" if UNION_PATHS else (_csv_param or (DEFAULT_CSV_URL if DEFAULT_CSV_URL else CSV_PATH))
 SRC_BASENAME = _infer_src_basename(_src_for_name)
 TS = datetime.now().strftime("%Y%m%d_%H%M%S")
 DL_NAME = f"muz01_{SRC_BASENAME}_{TS}.csv"
@@ -242,26 +324,176 @@ DL_STEM = DL_NAME[:-4] if DL_NAME.lower().endswith('.csv') else DL_NAME
 src_ph.caption(source_hint)
 st.success("目前預設載入本地檔案 d0.csv，可用 ?csv= 或側欄貼上 URL 變更來源。")
 
+# === 側欄：欄位與搜尋 / 每頁筆數（每次執行只畫一次） ===
+def _column_controls(cols: list):
+    # 換到欄位不同的來源時清掉舊的欄位選擇，否則 key 相同的 multiselect 會把上一個來源的選擇帶過來
+    if st.session_state.get("_cols_for") != list(cols):
+        for k in ("show_cols", "kw_cols"):
+            st.session_state.pop(k, None)
+        st.session_state["_cols_for"] = list(cols)
+    with st.sidebar:
+        st.subheader("欄位與搜尋")
+        show_cols = st.multiselect("顯示欄位", cols, default=cols[: min(10, len(cols))], key="show_cols")
+        kw_cols   = st.multiselect("關鍵字搜尋欄位", cols, default=show_cols or cols, key="kw_cols")
+        page_size = st.selectbox("每頁筆數", [25, 50, 100, 200, 500], index=2, key="page_size")
+        st.markdown("---")
+    return show_cols, kw_cols, page_size
+
+# === 來源結構快取：看過的來源（同一指紋）不必掃資料，先畫出欄位選單再匯入 ===
+SCHEMA = None
+COLUMN_CONTROLS = None
+if not UNION_PATHS and SCAN_SRC and not str(SCAN_SRC).lower().startswith(("http://", "https://")):
+    try:
+        SCHEMA = load_schema(source_key(SCAN_SRC))
+    except OSError:
+        SCHEMA = None
+if SCHEMA:
+    COLUMN_CONTROLS = _column_controls(column_names(SCHEMA))
+
+# === 背景工作：來源準備與換頁查詢在工作執行緒執行，換來源 / 換頁時以 DuckDB interrupt() 取消舊工作 ===
+def _get_jobs() -> Jobs:
+    if "muz_jobs" not in st.session_state:
+        st.session_state["muz_jobs"] = Jobs(_get_db())
+    return st.session_state["muz_jobs"]
+
+JOBS = _get_jobs()
+_POLL_AFTER_RUN = False  # 整頁執行中有工作未完成 → 畫完整頁後稍等再重跑一次
+
+def _job_progress(job, label: str):
+    frac, text = job.progress()
+    st.progress(min(max(frac or 0.0, 0.0), 1.0), text=f"{label}：{text or '執行中…'}（{job.elapsed():.0f} 秒）")
+
+def _last_page_view():
+    """新的一頁還在查詢時，照舊顯示上一次完成的頁面。"""
+    last = st.session_state.get("_last_page")
+    if last is None:
+        return
+    st.caption(last["caption"] + "（上一次的結果）")
+    st.dataframe(last["df"], column_config=last["col_cfg"], use_container_width=True, hide_index=True)
+
+# === 來源準備（背景）：遠端下載到本地位元組快取（ETag / If-Modified-Since 重新驗證）→ 匯入 Parquet ===
+def _prepare_source(cur, job, log, src: str, scan: str, union_paths):
+    """回傳 (scan, 來源路徑, 下載檔, Ingested, 查詢紀錄)；每一步開始前 job.report() 檢查是否已取消。"""
+    pcur = ProfiledCursor(cur, log)
+    fetched = None
+    if src and str(src).lower().startswith(("http://", "https://")):
+        # 已發佈的 Parquet（含 __rowid）直接查詢：經 httpfs 只以 Range 讀需要的列群組與欄位，不下載、不匯入
+        # httpfs 在這裡（第一次真的要讀遠端時）才載入，本地來源的冷啟動不必碰網路 / 擴充套件目錄
+        if src.lower().endswith(".parquet"):
+            job.report(None, "讀取中繼資料…")
+            with log.stage("httpfs"):
+                has_httpfs = JOBS.db.ensure_httpfs()
+            with log.stage("published"):
+                published = published_scan(pcur, src) if has_httpfs else None
+            if published:
+                return published, src, None, None, log
+        job.report(None, "下載遠端資料…")
+        def _on_bytes(done, total):
+            mb = f"{done / 1e6:.1f}" + (f" / {total / 1e6:.1f}" if total else "") + " MB"
+            job.report(done / total if total else None, f"下載中 {mb}")
+        try:
+            with log.stage("fetch"):
+                fetched = fetch(src, progress=_on_bytes)
+        except Exception:
+            fetched = None  # 下載失敗 → 沿用 httpfs 直接讀取，再不行走 pandas 後援
+        if not fetched:
+            with log.stage("httpfs"):
+                JOBS.db.ensure_httpfs()
+        else:
+            _q = fetched.replace("'", "''")
+            scan = f"parquet_scan('{_q}')" if src.lower().endswith(".parquet") else csv_scan(fetched)
+            src = fetched
+    job.report(None, "匯入資料…")
+    ingested = None
+    try:
+        with log.stage("ingest"):
+            ingested = ingest_union(pcur, union_paths) if union_paths else ingest(pcur, src, scan)
+    except Exception:
+        ingested = None  # 轉檔失敗（例如遠端讀不到）→ 沿用原始 scan，交給下方後援處理
+    job.report(1.0, "完成")
+    return scan, src, fetched, ingested, log
+
+_source_log = QueryLog(session=st.session_state["muz_session"])
+_source_job = JOBS.submit(
+    "source", (SCAN_SRC, scan, tuple(UNION_PATHS or ())),
+    lambda cur, job, _log=_source_log, _src=SCAN_SRC, _scan=scan, _union=UNION_PATHS: _prepare_source(cur, job, _log, _src, _scan, _union),
+)
+if not _source_job.wait(WAIT_SEC):
+    # 還在下載 / 匯入：顯示進度與取消鈕，上一個來源的頁面照舊留在畫面上
+    st.info(f"正在載入：{source_hint}")
+    _job_progress(_source_job, "載入來源")
+    if st.button("取消載入", key="btn_cancel_load"):
+        JOBS.cancel("source")
+        _prev_csv = st.session_state.get("_loaded_csv")
+        if _prev_csv != _csv_param:
+            try:
+                if _prev_csv:
+                    st.query_params.update({"csv": _prev_csv})
+                else:
+                    st.query_params.clear()
+            except Exception:
+                st.experimental_set_query_params(**({"csv": _prev_csv} if _prev_csv else {}))
+            st.rerun()
+        st.warning("已取消載入。")
+        _last_page_view()
+        st.stop()
+    _last_page_view()
+    time.sleep(POLL_SEC)
+    st.rerun()
+JOBS.take("source")  # 取走結果；下一輪整頁執行重新驗證（快取命中時很快）
+try:
+    scan, SCAN_SRC, FETCHED, INGESTED, _source_log = _source_job.get()
+except Exception as e:
+    st.error(f"載入來源失敗：{e}")
+    st.stop()
+st.session_state["_loaded_csv"] = _csv_param
+QLOG.events.extend(_source_log.events)
+if INGESTED is not None:
+    QLOG.cache("ingest", INGESTED.hit)
+    scan = INGESTED.scan
+    SCHEMA = INGESTED.schema
+
+# === 搜尋索引（背景）：匯入完成就先顯示頁面，索引另外建；建好前關鍵字搜尋走 ILIKE，之後自動改用索引 ===
+# 大型來源的索引可能比資料本身大、建置要好幾十秒，不能擋住第一頁；同一來源每個 session 只嘗試一次（失敗就一直用 ILIKE）
+if INGESTED is not None:
+    _has_index = has_index(INGESTED)
+    QLOG.cache("index", _has_index)
+    _index_job = JOBS.get("index")
+    if not _has_index and (_index_job is None or _index_job.key != INGESTED.key):
+        JOBS.submit("index", INGESTED.key, lambda cur, job, _ing=INGESTED: ensure_index(cur, _ing), label="index")
+
 # === 偵錯區（?debug=1 時顯示解析後參數） ===
+_dbg_panel = st.container()
 try:
-    _dbg = _qp.get("debug", "")
-    _dbg = _dbg[0] if isinstance(_dbg, list) else _dbg
-    if str(_dbg) in ("1","true","yes"):
+    if DEBUG:
         st.info({
             "csv_param_raw": _csv_param,
             "resolved_url": RESOLVED_URL,
+            "fetched": FETCHED,
             "source_hint": source_hint,
+            "scan": scan,
+            "ingest_cache": (INGESTED.path if INGESTED else None),
+            "ingest_hit": (INGESTED.hit if INGESTED else None),
+            "schema": ({k: v for k, v in SCHEMA.items() if k != "columns"} if SCHEMA else None),
+            "httpfs_error": _get_db().httpfs_error,
+            "warmup": {"done": WARMUP.done, "total": len(WARMUP.paths), "errors": WARMUP.errors,
+                       "seconds": round((WARMUP.finished_at or time.time()) - WARMUP.started_at, 2)},
         })
 except Exception:
     pass
 
-# === 預覽欄位（以便生成 UI） ===
+# === 預覽欄位（以便生成 UI）：有匯入快取時直接用結構快取，不查資料 ===
 try:
-    preview = con.execute(f"SELECT * FROM {scan} LIMIT 1").fetchdf()
+    if INGESTED is not None and INGESTED.schema:
+        preview_cols = column_names(INGESTED.schema) + [ROWID]
+    else:
+        with QLOG.stage("preview"):
+            preview_cols = [r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {scan}").fetchall()]
 except Exception as e:
     # 後援：對遠端 URL 嘗試用 pandas 載入，再註冊成 DuckDB 臨時 view
     if RESOLVED_URL:
         try:
+            import pandas as pd
             if RESOLVED_URL.lower().endswith('.parquet'):
                 _df_all = pd.read_parquet(RESOLVED_URL)
             else:
@@ -269,7 +501,14 @@ except Exception as e:
             con.register('remote_fallback', _df_all)
             scan = 'remote_fallback'
             source_hint = source_hint + "（pandas 後援載入）"
-            preview = con.execute(f"SELECT * FROM {scan} LIMIT 1").fetchdf()
+            try:
+                INGESTED = ingest(con, SCAN_SRC, scan)
+            except Exception:
+                INGESTED = None
+            if INGESTED is not None:
+                scan = INGESTED.scan
+                SCHEMA = INGESTED.schema
+            preview_cols = con.execute(f"SELECT * FROM {scan} LIMIT 0").fetchdf().columns.tolist()
         except Exception as ee:
             st.error(f"""讀取資料結構失敗：{e}
 遠端後援也失敗：{ee}
@@ -279,7 +518,9 @@ except Exception as e:
         st.error(f"讀取資料結構失敗：{e}")
         st.stop()
 
-cols = preview.columns.tolist()
+cols = [c for c in preview_cols if c != ROWID]
+HAS_ROWID = ROWID in preview_cols  # 匯入快取才有 __rowid；後援 view 沒有時改回 OFFSET 分頁
+SOURCE_ID = INGESTED.key if INGESTED else f"{SCAN_SRC}|{scan}"
 if not cols:
     st.error("CSV 沒有欄位。")
     st.stop()
@@ -291,129 +532,446 @@ if missing_sk:
     st.warning("""本 CSV 缺少必備欄位：""" + ", ".join(missing_sk) + """。
 表格仍可瀏覽，但「sk節點」與「Sankey」將無法正確顯示；請補上 sk1、sk2、sk3 三欄。""")
 
-# === 側欄：欄位與搜尋 / 每頁筆數 ===
-with st.sidebar:
-    st.subheader("欄位與搜尋")
-    show_cols = st.multiselect("顯示欄位", cols, default=cols[: min(10, len(cols))])
-    kw_cols   = st.multiselect("關鍵字搜尋欄位", cols, default=show_cols or cols)
-    page_size = st.selectbox("每頁筆數", [25, 50, 100, 200, 500], index=2)
-    st.markdown("---")
+if COLUMN_CONTROLS is None:
+    COLUMN_CONTROLS = _column_controls(cols)
+show_cols, kw_cols, page_size = COLUMN_CONTROLS
+
+# === 片段（fragment）：互動只重跑相依的區塊，不再整頁從頭執行 ===
+# - 表格片段：翻頁 → 只重跑搜尋、計數（已快取）與當頁查詢；關鍵字輸入框在片段外，改關鍵字整頁重跑一次（分面筆數跟著更新）
+# - sk 節點片段：切換檢視方式；Sankey 片段：滑桿只重新篩選已快取的連線表
+# - 下載片段（側欄）：產生完整結果時只重跑自己，條件取自表格片段最後一次的狀態
+# 來源、欄位、計數、頁邊界、sk 彙總都包在 st.cache_data 裡；整頁 rerun（換來源 / 欄位 / 每頁筆數 / 分頁籤 / 關鍵字）也只剩當頁查詢
+# st.fragment 與 st.rerun(scope=...) 都需要 Streamlit 1.37 以上（requirements.txt 已固定下限）
+_fragment = st.fragment
+_FULL_RUN = True  # 整頁執行結束時設為 False；之後片段單獨重跑時另開一份查詢紀錄
+
+def _fragment_begin(name: str) -> bool:
+    """片段單獨重跑時換新的 QueryLog / ProfiledCursor；整頁執行中呼叫則沿用。"""
+    global QLOG, con
+    if _FULL_RUN:
+        return False
+    QLOG = QueryLog(session=st.session_state["muz_session"])
+    QLOG.record(kind="rerun", trigger=f"fragment:{name}|" + _rerun_trigger(), csv=_qp_get("csv"))
+    con = ProfiledCursor(_session_cursor(), QLOG, profile=PROFILE)
+    return True
+
+def _fragment_end(alone: bool):
+    if not alone:
+        return
+    QLOG.flush()
+    con.close_profile()
+    st.session_state["_trigger_snapshot"] = _trigger_snapshot()
+    if DEBUG:
+        st.caption("⏱ 片段重跑：" + "，".join(f"{e['stage']} {e['ms']:.1f} ms" for e in QLOG.stage_events()))
 
 # === 搜尋條件 ===
-kw_value = st.session_state.get("keyword", "")
-where = "TRUE"
-params = {}
-if kw_value and kw_cols:
-    like_parts = [f'CAST("{c}" AS TEXT) ILIKE $kw' for c in kw_cols]
-    where = "(" + " OR ".join(like_parts) + ")"
-    params["kw"] = f"%{kw_value}%"
-
-# === 計數（搜尋後 / 原始基準） ===
-try:
-    total = con.execute(f"SELECT COUNT(*) FROM {scan} WHERE {where}", params).fetchone()[0]
-    base_total = con.execute(f"SELECT COUNT(*) FROM {scan}").fetchone()[0]
-except Exception as e:
-    st.error(f"計數失敗：{e}")
-    st.stop()
+# 有索引時：由索引取得依相關度排序的 __rowid，計數 = 命中數、分頁直接切命中清單；
+# 關鍵字含 % 或 _（ILIKE 萬用字元）或沒有索引時，維持原本的 ILIKE 全表條件。
+@st.cache_data(show_spinner=False, max_entries=128)
+def _cached_search(_con, _ingested, source_id: str, kw: str, kw_cols: tuple) -> list:
+    return search(_con, _ingested, kw, list(kw_cols))
+
+def _search_condition(kw_value: str):
+    """回傳 (where, params, 命中的 __rowid 清單或 None)。"""
+    where, params, hits = "TRUE", {}, None
+    if not (kw_value and kw_cols):
+        return where, params, hits
+    if HAS_ROWID and has_index(INGESTED) and not any(ch in kw_value for ch in "%_"):
+        try:
+            with QLOG.stage("search", cached=True):
+                hits = _cached_search(con, INGESTED, SOURCE_ID, kw_value, tuple(kw_cols))
+        except Exception:
+            hits = None
+    if hits is not None:
+        where = f'"{ROWID}" IN (SELECT unnest($hits))'
+        params["hits"] = hits
+    else:
+        like_parts = [f'CAST("{c}" AS TEXT) ILIKE $kw' for c in kw_cols]
+        where = "(" + " OR ".join(like_parts) + ")"
+        params["kw"] = f"%{kw_value}%"
+    return where, params, hits
+
+# === 計數（搜尋後 / 原始基準）：依 (來源, 條件, 關鍵字) 快取，關鍵字不變時不重算 ===
+@st.cache_data(show_spinner=False, max_entries=256)
+def _cached_count(_con, source_id: str, scan: str, where: str, params: dict) -> int:
+    return count_rows(_con, scan, where, params)
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _cached_page_bounds(_con, source_id: str, scan: str, where: str, params: dict, page_size: int, total: int) -> list:
+    return page_bounds(_con, scan, where, params, page_size, total)
+
+# === 分面篩選（側欄）：category / era / sk1～sk3 各值筆數來自來源的分面彙總表，勾選後與關鍵字條件一起套用 ===
+# 筆數依目前條件即時計算（每個分面排除自己的勾選）；有關鍵字時只彙總命中的列，依 (來源, 勾選, 關鍵字) 快取
+# 選項固定用來源整體的值與順序、標籤不含筆數（筆數另列在 caption）：選項或標籤一變，舊版 Streamlit 會換掉元件、丟掉勾選
+FACET_COLS = facet_cols(cols)
+FACET_CAPTION_TOP = 12  # caption 只列筆數最多的前幾個值
+FACET_SELECTED = {c: list(st.session_state.get(f"facet_{c}") or []) for c in FACET_COLS}
+FACET_ACTIVE = any(FACET_SELECTED.values())
+FACET_SCAN_SQL = facet_where(FACET_SELECTED, on_scan=True)
+KEYWORD = st.session_state.get("keyword", "")  # 關鍵字輸入框在片段外：改關鍵字整頁重跑一次，側欄筆數與表格同步
+
+def _facet_cube(_con, _ingested, scan: str) -> str:
+    return cube_source(_con, _ingested, scan, FACET_COLS, HAS_ROWID)
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _cached_facet_counts(_con, _ingested, source_id: str, scan: str, selected: dict, kw_where: str, kw_params: dict) -> dict:
+    kw_cube = cube_sql(scan, FACET_COLS, HAS_ROWID, kw_where) if kw_where != "TRUE" else None
+    return facet_counts(_con, _facet_cube(_con, _ingested, scan), FACET_COLS, selected, kw_cube, kw_params)
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _cached_facet_total(_con, _ingested, source_id: str, scan: str, selected: dict) -> int:
+    return facet_total(_con, _facet_cube(_con, _ingested, scan), selected)
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def _cached_facet_hits(_con, source_id: str, scan: str, selected: dict, hits: list) -> list:
+    return filter_hits(_con, scan, hits, selected)
+
+if FACET_COLS:
+    try:
+        _kw_where, _kw_params, _ = _search_condition(KEYWORD)
+        with QLOG.stage("facets", cached=True):
+            FACET_OPTIONS = _cached_facet_counts(con, INGESTED, SOURCE_ID, scan, {}, "TRUE", {})
+            FACET_COUNTS = _cached_facet_counts(con, INGESTED, SOURCE_ID, scan, FACET_SELECTED, _kw_where, _kw_params)
+    except Exception:
+        FACET_COUNTS = None  # 彙總失敗就不顯示分面（表格照常）
+    if FACET_COUNTS:
+        with st.sidebar:
+            st.subheader("分面篩選")
+            for c in FACET_COLS:
+                options = [v for v, _ in FACET_OPTIONS[c]]
+                options += [v for v in FACET_SELECTED[c] if v not in options]
+                st.multiselect(c, options, key=f"facet_{c}")
+                counts = FACET_COUNTS[c]
+                st.caption("　".join(f"{v} {n:,}" for v, n in counts[:FACET_CAPTION_TOP]) + ("　…" if len(counts) > FACET_CAPTION_TOP else "")
+                           if counts else "（目前條件下沒有值）")
+            st.markdown("---")
+
+def _filter_condition(kw_value: str):
+    """關鍵字條件再加上分面勾選；回傳格式同 _search_condition。"""
+    where, params, hits = _search_condition(kw_value)
+    if not FACET_ACTIVE:
+        return where, params, hits
+    if hits is not None:
+        with QLOG.stage("facet_hits", cached=True):
+            hits = _cached_facet_hits(con, SOURCE_ID, scan, FACET_SELECTED, hits)
+        params["hits"] = hits
+    else:
+        where = FACET_SCAN_SQL if where == "TRUE" else f"({where}) AND {FACET_SCAN_SQL}"
+    return where, params, hits
 
-total_pages = max(1, math.ceil(total / page_size))
-base_pages  = max(1, math.ceil(base_total / page_size))
-
-# === 分頁控制 ===
-if "page" not in st.session_state or st.session_state.page < 1 or st.session_state.page > total_pages:
-    st.session_state.page = 1
-b1, b2, b3, b4 = st.columns(4)
-with b1:
-    if st.button("⏮ 第一頁"): st.session_state.page = 1
-with b2:
-    if st.button("◀ 上一頁") and st.session_state.page > 1: st.session_state.page -= 1
-with b3:
-    if st.button("下一頁 ▶") and st.session_state.page < total_pages: st.session_state.page += 1
-with b4:
-    if st.button("最後一頁 ⏭"): st.session_state.page = total_pages
-page = st.session_state.page
-
-# === 查詢當頁 ===
-offset = (page - 1) * page_size
 select_cols_sql = ", ".join([f'"{c}"' for c in (show_cols or cols)])
-q_page = f"""
-    SELECT {select_cols_sql}
-    FROM {scan}
-    WHERE {where}
-    LIMIT {int(page_size)} OFFSET {int(offset)}
-"""
-try:
-    df_page = con.execute(q_page, params).fetchdf()
-except Exception as e:
-    st.error(f"讀取頁面資料失敗：{e}")
-    st.stop()
 
-# === 自動辨識連結欄／圖片欄（表格用） ===
-def find_col(df: pd.DataFrame, candidates):
-    cands = {c.lower() for c in candidates}
-    for c in df.columns:
-        if c.lower() in cands:
-            return c
-    return None
-
-link_col  = find_col(df_page, {"url", "link", "api_link", "href"})
-image_override = IMAGE_COL_OVERRIDE if (IMAGE_COL_OVERRIDE and IMAGE_COL_OVERRIDE in df_page.columns) else None
-image_col = image_override or find_col(df_page, {"imageurl","image_url","imageurl_s","thumb","thumbnail","img","image"})
-col_cfg = {}
-if link_col:
-    col_cfg[link_col] = st.column_config.LinkColumn(label=link_col, display_text="開啟連結")
-if image_col:
-    col_cfg[image_col] = st.column_config.ImageColumn(label=image_col, help="縮圖預覽")
-
-# ================= Tabs：表格 / sk節點 / Sankey =================
-tab_table, tab_nodes, tab_sankey = st.tabs(["📊 表格", "🔖 sk節點", "🪢 Sankey"]) 
-
-with tab_table:
-    st.subheader("資料表（當頁）")
-    # 把搜尋輸入與統計移到表格分頁
-    keyword = st.text_input("關鍵字（ILIKE 模糊搜尋）", value=kw_value, key="keyword")
-    if kw_value and kw_cols:
+def _query_page(p: int, select_sql: str, where: str, params: dict, hits, bounds, cur=None):
+    """取第 p 頁的 select_sql 欄位（有 __rowid 時以頁邊界 seek；縮圖預抓下一頁時也用同一套分頁方式）。
+
+    cur 為背景工作的 cursor；未指定時用本 session 的 cursor。
+    """
+    con = cur or globals()["con"]
+    if hits is not None:
+        return fetch_rows(con, scan, select_sql, hits[(p - 1) * page_size: p * page_size])
+    if bounds is not None:
+        return fetch_page(con, scan, select_sql, where, params, bounds, p, page_size)
+    offset = (p - 1) * page_size
+    q_page = f"""
+        SELECT {select_sql}
+        FROM {scan}
+        WHERE {where}
+        LIMIT {int(page_size)} OFFSET {int(offset)}
+    """
+    return con.execute(q_page, params).fetchdf()
+
+def _next_page_urls(p: int, select_sql: str, where: str, params: dict, hits, bounds, image_col: str) -> list:
+    """縮圖預抓用：在背景執行緒以獨立 cursor 取第 p 頁的圖片網址。"""
+    cur = _get_db().cursor()
+    try:
+        return _query_page(p, select_sql, where, params, hits, bounds, cur=cur)[image_col].tolist()
+    finally:
+        cur.close()
+
+def _static_serving() -> bool:
+    try:
+        return bool(st.get_option("server.enableStaticServing"))
+    except Exception:
+        return False
+
+# === 自動辨識連結欄／圖片欄（表格用）：結構快取已記錄時直接使用 ===
+def _known_col(kind: str, columns, candidates):
+    c = (SCHEMA or {}).get(kind)
+    return c if c in columns else find_col(columns, candidates)
+
+# ================= 分頁：表格 / sk節點 / Sankey =================
+# 以水平 radio 當分頁選單（所有支援的 Streamlit 版本都有），每輪只畫目前選到的分頁，其他分頁完全不查詢
+_TAB_LABELS = ["📊 表格", "🔖 sk節點", "🪢 Sankey"]
+MAIN_TAB = st.radio("分頁", _TAB_LABELS, horizontal=True, key="main_tab", label_visibility="collapsed")
+
+# sk 彙總（唯一組合 / 節點標籤）在 DuckDB 內 GROUP BY，依來源快取；
+# 節點標籤即 sk 欄的字典：組合表的 sk 欄是 Categorical；Sankey 的連線另由縮減圖產生，src / dst 直接是標籤索引
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_sk(_con, _ingested, source_id: str, scan: str):
+    combos = combos_source(_con, _ingested, scan)
+    labels = sk_labels(_con, combos)
+    return sk_combos(_con, combos, labels), labels
+
+# Sankey 縮減圖（每層前 N 名 + 其他、累積占比、sk1 聚焦）：依 (來源, 參數) 快取，圖的大小與資料列數無關
+@st.cache_data(show_spinner=False, max_entries=128)
+def _cached_sankey(_con, _ingested, source_id: str, scan: str, facets: dict, top_n: int, share: float, sk1):
+    return reduce_graph(_con, _sankey_combos(_con, _ingested, scan, facets), top_n, share, sk1)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_sk1_totals(_con, _ingested, source_id: str, scan: str, facets: dict) -> list:
+    return sk1_totals(_con, _sankey_combos(_con, _ingested, scan, facets))
+
+def _sankey_combos(_con, _ingested, scan: str, facets: dict) -> str:
+    """有分面勾選時改由分面彙總表取 sk 組合（同樣不掃原始資料）。"""
+    if any(facets.values()):
+        return facet_combos(_facet_cube(_con, _ingested, scan), facets)
+    return combos_source(_con, _ingested, scan)
+
+@_fragment
+def _table_view():
+    global _POLL_AFTER_RUN
+    alone = _fragment_begin("table")
+    kw_value = KEYWORD
+    where, params, hits = _filter_condition(kw_value)
+    try:
+        with QLOG.stage("count", cached=True):
+            base_total = _cached_count(con, SOURCE_ID, scan, "TRUE", {})
+        if hits is not None:
+            total = len(hits)
+        elif where == "TRUE":
+            total = base_total
+        elif where == FACET_SCAN_SQL:
+            # 只有分面勾選：總筆數直接由分面彙總表加總
+            with QLOG.stage("count_filtered", cached=True):
+                total = _cached_facet_total(con, INGESTED, SOURCE_ID, scan, FACET_SELECTED)
+        else:
+            with QLOG.stage("count_filtered", cached=True):
+                total = _cached_count(con, SOURCE_ID, scan, where, params)
+    except Exception as e:
+        st.error(f"計數失敗：{e}")
+        return _fragment_end(alone)
+
+    total_pages = max(1, math.ceil(total / page_size))
+    base_pages  = max(1, math.ceil(base_total / page_size))
+
+    # === 分頁控制 ===
+    if "page" not in st.session_state or st.session_state.page < 1 or st.session_state.page > total_pages:
+        st.session_state.page = 1
+    b1, b2, b3, b4 = st.columns(4)
+    with b1:
+        if st.button("⏮ 第一頁", key="btn_first"): st.session_state.page = 1
+    with b2:
+        if st.button("◀ 上一頁", key="btn_prev") and st.session_state.page > 1: st.session_state.page -= 1
+    with b3:
+        if st.button("下一頁 ▶", key="btn_next") and st.session_state.page < total_pages: st.session_state.page += 1
+    with b4:
+        if st.button("最後一頁 ⏭", key="btn_last"): st.session_state.page = total_pages
+    page = st.session_state.page
+
+    # === 查詢當頁 ===
+    bounds = None
+    try:
+        if hits is None and HAS_ROWID:
+            with QLOG.stage("page_bounds", cached=True):
+                bounds = _cached_page_bounds(con, SOURCE_ID, scan, where, params, int(page_size), int(total))
+    except Exception as e:
+        st.error(f"讀取頁面資料失敗：{e}")
+        return _fragment_end(alone)
+    # 當頁查詢在背景執行：換頁 / 改關鍵字會取消還沒跑完的上一個查詢；等不到結果時先顯示上一頁
+    _page_log = QueryLog(session=st.session_state["muz_session"])
+    job = JOBS.submit(
+        "page", (SOURCE_ID, select_cols_sql, where, FACET_SCAN_SQL, kw_value, tuple(kw_cols), page, int(page_size)),
+        lambda cur, job, _log=_page_log, _p=page, _sel=select_cols_sql, _w=where, _params=params, _hits=hits, _bounds=bounds:
+            (_query_page(_p, _sel, _w, _params, _hits, _bounds, cur=ProfiledCursor(cur, _log)), _log),
+    )
+    if not job.wait(WAIT_SEC):
+        _job_progress(job, f"查詢第 {page} 頁")
+        _last_page_view()
+        if alone:
+            _fragment_end(alone)
+            time.sleep(POLL_SEC)
+            st.rerun(scope="fragment")
+        _POLL_AFTER_RUN = True  # 整頁執行中不能只重跑片段 → 畫完整頁後再重跑
+        return
+    try:
+        df_page, _page_log = job.get()
+    except Exception as e:
+        st.error(f"讀取頁面資料失敗：{e}")
+        return _fragment_end(alone)
+    # 結果可跨輪重用（key 相同即同一頁）；查詢紀錄只在第一次取用時併入
+    if job.logged:
+        QLOG.record(kind="stage", stage="page", ms=0.0, queries=0, cache="hit")
+    else:
+        job.logged = True
+        QLOG.events.extend(_page_log.events)
+        QLOG.record(kind="stage", stage="page", ms=round(job.elapsed() * 1000.0, 2),
+                    queries=len([e for e in _page_log.events if e.get("kind") == "query"]), cache="miss")
+    # 側欄下載片段依此匯出完整結果
+    st.session_state["_view_query"] = {"select": select_cols_sql, "where": where, "params": params}
+
+    link_col  = _known_col("link_col", df_page.columns, LINK_CANDIDATES)
+    image_override = IMAGE_COL_OVERRIDE if (IMAGE_COL_OVERRIDE and IMAGE_COL_OVERRIDE in df_page.columns) else None
+    image_col = image_override or _known_col("image_col", df_page.columns, IMAGE_CANDIDATES)
+    col_cfg = {}
+    if link_col:
+        col_cfg[link_col] = st.column_config.LinkColumn(label=link_col, display_text="開啟連結")
+    if image_col:
+        col_cfg[image_col] = st.column_config.ImageColumn(label=image_col, help="縮圖預覽")
+
+    # === 縮圖代理：已快取的圖改用 App 靜態路徑的縮圖，其餘先用原網址並在背景下載；MUZ_THUMBS=0 可關閉 ===
+    # 需開啟 server.enableStaticServing；下載當頁仍用原始網址，只有顯示用的 df_view 換成縮圖
+    df_view = df_page
+    use_thumbs = bool(image_col) and os.environ.get("MUZ_THUMBS", "1") != "0" and _static_serving()
+    if use_thumbs:
+        try:
+            with QLOG.stage("thumbs"):
+                df_view = df_page.assign(**{image_col: thumbs.serve(df_page[image_col].tolist())})
+        except Exception:
+            df_view = df_page  # 縮圖失敗就照舊讓瀏覽器直接載入原圖
+
+    if (kw_value and kw_cols) or FACET_ACTIVE:
         st.write(f"符合條件：{total:,} 筆；第 {page} / {total_pages} 頁  ({base_total:,} 筆；第 1 / {base_pages} 頁)")
     else:
         st.write(f"符合條件：{total:,} 筆；第 {page} / {total_pages} 頁")
-    st.data_editor(df_page, column_config=col_cfg, use_container_width=True, hide_index=True, disabled=True)
+    with QLOG.stage("render_table"):
+        st.data_editor(df_view, column_config=col_cfg, use_container_width=True, hide_index=True, disabled=True)
+    st.session_state["_last_page"] = {"df": df_view, "col_cfg": col_cfg, "caption": f"第 {page} / {total_pages} 頁"}
+    if use_thumbs and page < total_pages:
+        # 下一頁的圖片網址在縮圖執行緒池裡查（自己的 cursor），不佔用當頁的顯示時間；同一頁只排一次
+        prefetch_key = (job.key, image_col)
+        if st.session_state.get("_thumbs_prefetched") != prefetch_key:
+            st.session_state["_thumbs_prefetched"] = prefetch_key
+            thumbs.prefetch_later(
+                lambda _p=page + 1, _sel=f'"{image_col}"', _w=where, _params=params, _hits=hits, _bounds=bounds, _c=image_col:
+                    _next_page_urls(_p, _sel, _w, _params, _hits, _bounds, _c))
+    st.download_button("下載當頁", df_page.to_csv(index=False).encode("utf-8"), DL_NAME, "text/csv")
+    _fragment_end(alone)
 
-with tab_nodes:
-    st.subheader("sk 節點（不套用搜尋 / 不分頁，固定顯示 id, sk1, sk2, sk3）")
-    if missing_sk:
-        st.error("此 CSV 不包含 sk1、sk2、sk3 三欄，無法顯示 sk 節點表。請補齊後再試。")
+@_fragment
+def _nodes_view():
+    alone = _fragment_begin("sk_nodes")
+    with QLOG.stage("sk_agg", cached=True):
+        sk_table, labels = _cached_sk(con, INGESTED, SOURCE_ID, scan)
+    # 原始列只取需要的欄位（忽略 WHERE 與分頁），缺值在 SQL 內補上；sk 欄以標籤字典編碼（Categorical）
+    q_nodes = sk_nodes_sql(scan, "id" in cols, labels)
+
+    view = st.radio("檢視方式", ["原始列（id, sk1, sk2, sk3）", "唯一組合 + 計數（sk1, sk2, sk3）"], horizontal=True, key="sk_view")
+    if view.startswith("唯一"):
+        df_nodes = sk_table
     else:
-        # 讀取完整資料（忽略 WHERE 與分頁），僅取需要的欄位
-        base_cols = ["sk1", "sk2", "sk3"]
-        cols_exist = [c for c in ["id"] + base_cols if c in cols]
-        sel_cols_nodes = ", ".join([f'"{c}"' for c in cols_exist])
-        q_nodes = f"SELECT {sel_cols_nodes} FROM {scan}"
-        df_nodes_full = con.execute(q_nodes).fetchdf().fillna("（缺值）")
-        if "id" not in df_nodes_full.columns:
-            df_nodes_full.insert(0, "id", "")
-        df_nodes_full = df_nodes_full[["id", "sk1", "sk2", "sk3"]]
-
-        view = st.radio("檢視方式", ["原始列（id, sk1, sk2, sk3）", "唯一組合 + 計數（sk1, sk2, sk3）"], horizontal=True)
+        with QLOG.stage("sk_nodes"):
+            df_nodes = con.execute(q_nodes).fetchdf()
+
+    st.data_editor(df_nodes, use_container_width=True, hide_index=True, disabled=True)
+
+    cna1, cna2 = st.columns(2)
+    with cna1:
         if view.startswith("唯一"):
-            df_nodes = (
-                df_nodes_full[["sk1","sk2","sk3"]]
-                .value_counts(["sk1","sk2","sk3"])  # pandas >= 1.4
-                .rename("count").reset_index()
-                .sort_values("count", ascending=False)
-            )
+            # 唯一組合表很小（筆數與資料列數無關），直接在記憶體組 CSV
+            st.download_button("下載 sk 節點（當前檢視）", data=df_nodes.to_csv(index=False).encode("utf-8-sig"), file_name=DL_STEM + "_nodes.csv", mime="text/csv")
         else:
-            df_nodes = df_nodes_full
+            # 原始列檢視即 sk 原始：不在每次畫面更新時組整份 CSV，改用右側按鈕由 DuckDB 寫檔
+            st.caption("原始列請用「產生 sk 原始」下載（由 DuckDB 直接寫檔）。")
+    with cna2:
+        # 原始列可能很大：由 DuckDB 直接寫暫存檔，不在記憶體組 CSV 字串
+        if st.button("產生 sk 原始（id, sk1, sk2, sk3）", key="btn_sk_raw"):
+            with QLOG.stage("export_sk_raw"):
+                _raw_path = export_query(con, q_nodes, fmt="CSV", bom=True)
+            with open(_raw_path, "rb") as f:
+                st.download_button("下載 sk 原始（id, sk1, sk2, sk3）", f, DL_STEM + "_raw.csv", "text/csv")
+    _fragment_end(alone)
 
-        st.data_editor(df_nodes, use_container_width=True, hide_index=True, disabled=True)
+@_fragment
+def _sankey_view(go):
+    alone = _fragment_begin("sankey")
+    # 先在 DuckDB 內縮減（與「sk節點」同一份組合彙總）；最小權重滑桿只重新篩選縮減後的小連線表
+    with QLOG.stage("sk1_totals", cached=True):
+        totals = _cached_sk1_totals(con, INGESTED, SOURCE_ID, scan, FACET_SELECTED)
+    c1, c2, c3 = st.columns([2, 1, 1])
+    with c1:
+        weights = dict(totals)
+        if st.session_state.get("sankey_sk1") not in (None, "（全部）") and st.session_state["sankey_sk1"] not in weights:
+            st.session_state["sankey_sk1"] = "（全部）"  # 分面勾選後原本聚焦的 sk1 已不在圖中
+        focus = st.selectbox("聚焦 sk1", ["（全部）"] + list(weights), key="sankey_sk1",
+                             format_func=lambda v: f"{v}（{weights[v]:,}）" if v in weights else v)
+    with c2:
+        top_n = st.number_input("每層最多節點", 3, 200, value=TOP_N, step=1, key="sankey_top_n")
+    with c3:
+        share = st.slider("累積占比（%）", 50, 100, value=int(round(SHARE * 100)), key="sankey_share")
+    sk1 = None if focus == "（全部）" else focus
+    with QLOG.stage("sankey_reduce", cached=True):
+        links_df, labels = _cached_sankey(con, INGESTED, SOURCE_ID, scan, FACET_SELECTED, int(top_n), share / 100.0, sk1)
 
-        cna1, cna2 = st.columns(2)
-        with cna1:
-            st.download_button("下載 sk 節點（當前檢視）", data=df_nodes.to_csv(index=False).encode("utf-8-sig"), file_name=DL_STEM + "_nodes.csv", mime="text/csv")
-        with cna2:
-            st.download_button("下載 sk 原始（id, sk1, sk2, sk3）", data=df_nodes_full.to_csv(index=False).encode("utf-8-sig"), file_name=DL_STEM + "_raw.csv", mime="text/csv")
+    vmax = int(max(1, int(links_df["value"].max()))) if not links_df.empty else 1
+    if st.session_state.get("sankey_min", 1) > vmax:
+        st.session_state["sankey_min"] = 1  # 換了聚焦 / 縮減參數後最大權重變小
+    # 分面勾選後可能只剩權重 1 的連線（或沒有連線），此時滑桿沒有可選範圍
+    min_val = st.slider("過濾：最小權重", 1, vmax, value=1, key="sankey_min") if vmax > 1 else 1
+    links_df = links_df[links_df["value"] >= min_val]
+
+    if links_df.empty:
+        st.info("過濾後沒有連線可顯示，請放寬門檻或更換資料條件。")
+    else:
+        fig = go.Figure(data=[go.Sankey(
+            node=dict(
+                label=labels,
+                pad=20,
+                thickness=18,
+                color="#FFFFFF",
+                line=dict(color="rgba(0,0,0,0)", width=0),
+            ),
+            link=dict(
+                source=links_df["src"],
+                target=links_df["dst"],
+                value=links_df["value"],
+                color="rgba(90,123,216,0.18)",
+            ),
+            textfont=dict(color="#0B1220", size=16, family="Microsoft JhengHei, Heiti TC, sans-serif"),
+        )])
+        fig.update_layout(
+            title_text="Sankey：sk1 → sk2 → sk3",
+            font_size=16,
+            font=dict(family="Microsoft JhengHei, Heiti TC, sans-serif", color="#0B1220"),
+            paper_bgcolor="#FFFFFF",
+            plot_bgcolor="#FFFFFF",
+            margin=dict(l=10, r=10, t=40, b=10),
+            hoverlabel=dict(bgcolor="#FFFFFF", font_size=14, font_family="Microsoft JhengHei, Heiti TC, sans-serif"),
+        )
+        with QLOG.stage("render_sankey"):
+            st.plotly_chart(fig, use_container_width=True)
+        st.caption(f"顯示 {len(labels):,} 個節點、{len(links_df):,} 條連線；節點超過 {int(top_n)} 個的層，未列入前 {int(top_n)} 名或累積占比 {share}% 之後的節點併入「{OTHER}」")
+    _fragment_end(alone)
+
+@_fragment
+def _download_view():
+    alone = _fragment_begin("download")
+    st.subheader("下載")
+    st.caption("下載完整篩選結果（當頁請用表格下方的「下載當頁」）")
+    export_fmt = st.selectbox("完整結果格式", list(FORMATS), index=0, key="export_fmt")
+    vq = st.session_state.get("_view_query")
+    if vq and st.button("產生完整 CSV" if export_fmt == "CSV" else f"產生完整 {export_fmt}", key="btn_export"):
+        # 每次請求各寫一個暫存檔（逾時自動清除），多人同時匯出不會互相覆蓋
+        with QLOG.stage("export"):
+            out = export_query(con, f"SELECT {vq['select']} FROM {scan} WHERE {vq['where']}", vq["params"], fmt=export_fmt)
+        with open(out, "rb") as f:
+            st.download_button("下載完整結果", f, DL_STEM + ext_of(export_fmt), mime_of(export_fmt))
+    _fragment_end(alone)
 
-with tab_sankey:
-    st.subheader("Sankey（固定使用 sk1 → sk2 → sk3；不套用搜尋、不分頁）")
+if MAIN_TAB == _TAB_LABELS[0]:
+    st.subheader("資料表（當頁）")
+    # 關鍵字輸入框放在表格片段外（同側欄欄位選單）：改關鍵字只整頁重跑一次，分面筆數與表格一起更新
+    st.text_input("關鍵字（模糊搜尋，依相關度排序）", key="keyword")
+    _table_view()
+
+elif MAIN_TAB == _TAB_LABELS[1]:
+    st.subheader("sk 節點（不套用搜尋 / 不分頁，固定顯示 id, sk1, sk2, sk3）")
+    if missing_sk:
+        st.error("此 CSV 不包含 sk1、sk2、sk3 三欄，無法顯示 sk 節點表。請補齊後再試。")
+    else:
+        _nodes_view()
+
+else:
+    st.subheader("Sankey（固定使用 sk1 → sk2 → sk3；套用分面篩選，不套用關鍵字、不分頁）")
     if missing_sk:
         st.error("此 CSV 不包含 sk1、sk2、sk3 三欄，無法繪製 Sankey。請補齊後再試。")
     else:
@@ -421,75 +979,41 @@ with tab_sankey:
             import plotly.graph_objects as go
         except ModuleNotFoundError:
             st.error("""找不到 Plotly。請先安裝：`pip install plotly` 或 `pip3 install plotly`。若用 Conda：`conda install -c plotly plotly`。
-（Tabs 已顯示；安裝後重啟即可顯示 Sankey）""")
+（安裝後重啟即可顯示 Sankey）""")
         else:
-            # 取與「sk節點」一致的資料來源（完整、不分頁、不搜尋）
-            q_nodes_for_sankey = f"SELECT \"sk1\", \"sk2\", \"sk3\" FROM {scan}"
-            df_nodes_for_sankey = con.execute(q_nodes_for_sankey).fetchdf().fillna("（缺值）")
-            work = df_nodes_for_sankey[["sk1","sk2","sk3"]].copy()
-
-            # 建立 links（sk1→sk2、sk2→sk3）
-            links = []
-            for a, b in [("sk1","sk2"),("sk2","sk3")]:
-                g = work.groupby([a,b], dropna=False, as_index=False).size()
-                g.rename(columns={"size":"value", a:"src", b:"dst"}, inplace=True)
-                links.append(g)
-            links_df = pd.concat(links, ignore_index=True)
-
-            vmax = int(max(1, int(links_df["value"].max())))
-            min_val = st.slider("過濾：最小權重", 1, vmax, value=1)
-            links_df = links_df[links_df["value"] >= min_val]
-
-            if links_df.empty:
-                st.info("過濾後沒有連線可顯示，請放寬門檻或更換資料條件。")
-            else:
-                labels = pd.unique(pd.concat([work["sk1"], work["sk2"], work["sk3"]], ignore_index=True)).tolist()
-                idx = {lab: i for i, lab in enumerate(labels)}
-                links_df = links_df.assign(
-                    source_id=links_df["src"].map(idx),
-                    target_id=links_df["dst"].map(idx),
-                )
-
-                fig = go.Figure(data=[go.Sankey(
-                    node=dict(
-                        label=labels,
-                        pad=20,
-                        thickness=18,
-                        color="#FFFFFF",
-                        line=dict(color="rgba(0,0,0,0)", width=0),
-                    ),
-                    link=dict(
-                        source=links_df["source_id"],
-                        target=links_df["target_id"],
-                        value=links_df["value"],
-                        color="rgba(90,123,216,0.18)",
-                    ),
-                    textfont=dict(color="#0B1220", size=16, family="Microsoft JhengHei, Heiti TC, sans-serif"),
-                )])
-                fig.update_layout(
-                    title_text="Sankey：sk1 → sk2 → sk3",
-                    font_size=16,
-                    font=dict(family="Microsoft JhengHei, Heiti TC, sans-serif", color="#0B1220"),
-                    paper_bgcolor="#FFFFFF",
-                    plot_bgcolor="#FFFFFF",
-                    margin=dict(l=10, r=10, t=40, b=10),
-                    hoverlabel=dict(bgcolor="#FFFFFF", font_size=14, font_family="Microsoft JhengHei, Heiti TC, sans-serif"),
-                )
-                st.plotly_chart(fig, use_container_width=True)
+            _sankey_view(go)
 
 # —— 側欄：下載區 ——
 with st.sidebar:
-    st.subheader("下載")
-    st.caption("下載當前頁面或完整篩選結果")
-    st.download_button("下載當頁", df_page.to_csv(index=False).encode("utf-8"), DL_NAME, "text/csv")
-    if st.button("產生完整 CSV"):
-        out = "/tmp/filtered.csv"
-        con.execute(
-            f"COPY (SELECT {select_cols_sql} FROM {scan} WHERE {where}) TO '{out}' (HEADER, DELIMITER ',')",
-            params,
-        )
-        with open(out, "rb") as f:
-            st.download_button("下載完整結果", f, DL_NAME, "text/csv")
+    _download_view()
+
+# === 查詢計時面板（?debug=1）：各階段耗時 / 快取命中，以及每個查詢的耗時、列數、掃描量 ===
+# 行程第一次完整執行時另記一筆啟動計時：模組匯入、建立資料庫、httpfs（有讀遠端才有）、整輪耗時
+@st.cache_resource
+def _boot() -> dict:
+    return {}
+
+BOOT = _boot()
+if not BOOT:
+    BOOT.update(imports_ms=IMPORT_MS, db_setup_ms=_get_db().setup_ms, httpfs_ms=_get_db().httpfs_ms,
+                first_run_ms=round((time.perf_counter() - _IMPORT_T0) * 1000.0, 2))
+    QLOG.record(kind="startup", **BOOT)
+QLOG.flush()
+con.close_profile()
+st.session_state["_trigger_snapshot"] = _trigger_snapshot()
+_FULL_RUN = False
+if DEBUG:
+    import pandas as pd
+    with _dbg_panel:
+        with st.expander(f"⏱ 查詢計時（run {QLOG.run_id}，{QLOG.events[0].get('trigger')}）", expanded=True):
+            st.caption("啟動（行程第一次執行）：" + "，".join(f"{k} {v} ms" for k, v in BOOT.items() if v is not None))
+            _stages = pd.DataFrame(QLOG.stage_events())
+            if not _stages.empty:
+                st.dataframe(_stages[[c for c in ["stage", "ms", "queries", "cache"] if c in _stages.columns]], use_container_width=True, hide_index=True)
+            _queries = pd.DataFrame(QLOG.query_events())
+            if not _queries.empty:
+                _qcols = ["stage", "exec_ms", "fetch_ms", "rows", "rows_scanned", "bytes_read", "duckdb_s", "error", "sql"]
+                st.dataframe(_queries[[c for c in _qcols if c in _queries.columns]], use_container_width=True, hide_index=True)
 
 # ===（進階）Hugo 自適應高度：從 App 回傳內容高度給父頁 ===
 # 說明：Firefox 在 iframe 內對 vh 計算較嚴格，建議改成 parent <-> iframe 的 postMessage 通訊
@@ -498,7 +1022,7 @@ with st.sidebar:
 #  2) 請在 Hugo shortcode 加上 window.addEventListener('message', ...) 接收並設定對應 iframe 的 style.height。
 try:
     from streamlit.components.v1 import html as _html
-    _is_embed = str((_qp.get("embed") if not isinstance(_qp.get("embed"), list) else _qp.get("embed")[0]) or "").lower() == "true"
+    _is_embed = _qp_get("embed").lower() == "true"
     if _is_embed:
         _html(
             """
@@ -522,3 +1046,8 @@ try:
         )
 except Exception:
     pass
+
+# === 背景工作未完成（整頁執行中不能只重跑片段）：整頁畫完後稍等再重跑，已完成的部分都有快取 ===
+if _POLL_AFTER_RUN:
+    time.sleep(POLL_SEC)
+    st.rerun()
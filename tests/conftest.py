@@ -0,0 +1,122 @@
+"""測試共用：快取目錄改到暫存區，另提供本機 HTTP 替身伺服器（http.server）。"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 必須在匯入 muz 之前設定：各 DiskLRU 在模組載入時就決定目錄
+os.environ.setdefault("MUZ_CACHE_DIR", tempfile.mkdtemp(prefix="muz_test_cache_"))
+os.environ.setdefault("MUZ_THUMB_DIR", os.path.join(os.environ["MUZ_CACHE_DIR"], "thumbs"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import glob  # noqa: E402
+
+import duckdb  # noqa: E402
+import pytest  # noqa: E402
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUNDLED = sorted(glob.glob(os.path.join(REPO, "d*_s1.csv")))
+
+
+@pytest.fixture(scope="session")
+def con():
+    c = duckdb.connect()
+    yield c
+    c.close()
+
+
+@pytest.fixture(scope="session")
+def bundled(con):
+    """隨附 CSV 各自匯入後的 Ingested（依檔名）；整個測試階段只匯入一次。"""
+    from muz.ingest import csv_scan, ingest
+    return {os.path.basename(p): ingest(con, p, csv_scan(p)) for p in BUNDLED}
+
+
+class Upstream:
+    """替身伺服器的路由與請求紀錄。
+
+    routes[path] = {"body": bytes, "etag": str 或 None, "status": int, "delay": 秒, "type": Content-Type}
+    log 記錄每個請求的 (method, path, 回應狀態, request headers)。
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.log = []
+        self.lock = threading.Lock()
+        self.base = ""
+
+    def add(self, path: str, body: bytes, etag: str = None, status: int = 200, delay: float = 0.0,
+            ctype: str = "application/octet-stream"):
+        self.routes[path] = {"body": body, "etag": etag, "status": status, "delay": delay, "type": ctype}
+        return self.base + path
+
+    def gets(self, path: str) -> list:
+        with self.lock:
+            return [e for e in self.log if e[0] == "GET" and e[1] == path]
+
+
+def _handler(up: Upstream):
+    class Handler(BaseHTTPRequestHandler):
+        def _serve(self, with_body: bool):
+            path = self.path.split("?", 1)[0]
+            route = up.routes.get(path)
+            status = 404 if route is None else route["status"]
+            if route is not None and route["delay"]:
+                time.sleep(route["delay"])
+            if status == 200 and route["etag"] and self.headers.get("If-None-Match") == route["etag"]:
+                status = 304
+            with up.lock:
+                up.log.append((self.command, path, status, dict(self.headers)))
+            if status != 200:
+                self.send_response(status)
+                if status == 304 and route["etag"]:
+                    self.send_header("ETag", route["etag"])
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            data = route["body"]
+            start, end = 0, len(data) - 1
+            rng = self.headers.get("Range", "")
+            if rng.startswith("bytes="):  # httpfs 讀 Parquet 時以 Range 只取部分位元組
+                lo, _, hi = rng[6:].partition("-")
+                start = int(lo) if lo else max(0, len(data) - int(hi))
+                end = min(int(hi), len(data) - 1) if lo and hi else len(data) - 1
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+            else:
+                self.send_response(200)
+            if route["etag"]:
+                self.send_header("ETag", route["etag"])
+            self.send_header("Content-Type", route["type"])
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+            if with_body:
+                self.wfile.write(data[start:end + 1])
+
+        def do_GET(self):
+            self._serve(True)
+
+        def do_HEAD(self):
+            self._serve(False)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+@pytest.fixture
+def upstream():
+    up = Upstream()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(up))
+    up.base = f"http://127.0.0.1:{server.server_address[1]}"
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    try:
+        yield up
+    finally:
+        server.shutdown()
+        server.server_close()
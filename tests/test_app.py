@@ -0,0 +1,43 @@
+"""streamlit_app.py：以 AppTest 驗證分面勾選在條件改變（筆數改變）後仍保留。"""
+import os
+
+import pytest
+
+from conftest import REPO
+
+testing = pytest.importorskip("streamlit.testing.v1")
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setenv("MUZ_THUMBS", "0")
+    monkeypatch.setenv("MUZ_QUERY_LOG", "off")
+    at = testing.AppTest.from_file(os.path.join(REPO, "streamlit_app.py"), default_timeout=300)
+    at.query_params["csv"] = "all"
+    at.run()
+    assert not at.exception
+    return at
+
+
+def _run(at):
+    at.run()
+    assert not at.exception, [e.value for e in at.exception]
+
+
+def test_facet_selection_survives_count_changes(app):
+    options = list(app.multiselect(key="facet_sk1").options)
+    app.multiselect(key="facet_sk1").select("故")
+    _run(app)
+    # 勾選後其他分面的筆數改變，但選項與標籤不變
+    assert list(app.multiselect(key="facet_sk1").options) == options
+    app.multiselect(key="facet_category").select("法帖")
+    _run(app)
+    app.text_input(key="keyword").set_value("王")
+    _run(app)
+    assert app.multiselect(key="facet_sk1").value == ["故"]
+    assert app.multiselect(key="facet_category").value == ["法帖"]
+    assert list(app.multiselect(key="facet_sk1").options) == options
+    app.text_input(key="keyword").set_value("")
+    _run(app)
+    assert app.multiselect(key="facet_sk1").value == ["故"]
+    assert app.multiselect(key="facet_category").value == ["法帖"]
@@ -0,0 +1,92 @@
+"""muz.facets：彙總表算出的分面筆數、總筆數與命中過濾，與直接在原始資料上用 pandas 計算一致。"""
+import pytest
+
+from conftest import BUNDLED
+from muz.facets import cube_source, cube_sql, facet_cols, facet_combos, facet_counts, facet_total, filter_hits
+from muz.ingest import ROWID, ingest_union
+from muz.sk import MISSING
+
+KW_WHERE = 'CAST("name" AS TEXT) ILIKE $kw'
+
+
+@pytest.fixture(scope="module")
+def union(con, bundled):
+    return ingest_union(con, BUNDLED)
+
+
+@pytest.fixture(scope="module")
+def frame(con, union):
+    cols = facet_cols([r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {union.scan}").fetchall()])
+    quoted = ", ".join(f'"{c}"' for c in cols)
+    df = con.execute(f'SELECT "{ROWID}", "name", {quoted} FROM {union.scan}').fetchdf()
+    df[cols] = df[cols].astype(object).where(df[cols].notna(), MISSING).astype(str)
+    return df, cols
+
+
+def _mask(df, selected: dict, skip: str = None):
+    m = df[ROWID].notna()
+    for c, values in selected.items():
+        if values and c != skip:
+            m &= df[c].isin(values)
+    return m
+
+
+def _want_counts(df, cols, selected) -> dict:
+    out = {}
+    for c in cols:
+        vc = df[_mask(df, selected, skip=c)][c].value_counts()
+        out[c] = {v: int(n) for v, n in vc.items()}
+    return out
+
+
+def _got_counts(got: dict) -> dict:
+    return {c: dict(pairs) for c, pairs in got.items()}
+
+
+SELECTIONS = [
+    {},
+    {"sk1": ["故"]},
+    {"sk1": ["故"], "category": ["法帖"]},
+    {"sk2": ["帖", "書"], "era": [MISSING]},
+]
+
+
+@pytest.mark.parametrize("selected", SELECTIONS)
+def test_counts_match_pandas(con, union, frame, selected):
+    df, cols = frame
+    cube = cube_source(con, union, union.scan, cols, True)
+    got = facet_counts(con, cube, cols, selected)
+    assert _got_counts(got) == _want_counts(df, cols, selected)
+    for pairs in got.values():
+        assert [n for _, n in pairs] == sorted((n for _, n in pairs), reverse=True)
+    assert facet_total(con, cube, selected) == int(_mask(df, selected).sum())
+
+
+@pytest.mark.parametrize("selected", SELECTIONS)
+@pytest.mark.parametrize("kw", ["王", "山水"])
+def test_keyword_counts_match_pandas(con, union, frame, selected, kw):
+    df, cols = frame
+    cube = cube_source(con, union, union.scan, cols, True)
+    kw_cube = cube_sql(union.scan, cols, True, KW_WHERE)
+    got = facet_counts(con, cube, cols, selected, kw_cube=kw_cube, params={"kw": f"%{kw}%"})
+    hit = df[df["name"].fillna("").str.lower().str.contains(kw.lower(), regex=False)]
+    assert _got_counts(got) == _want_counts(hit, cols, selected)
+
+
+def test_combos_follow_selection(con, union, frame):
+    df, cols = frame
+    cube = cube_source(con, union, union.scan, cols, True)
+    selected = {"category": ["法帖"]}
+    got = con.execute(f"SELECT sk1, sk2, sk3, count FROM {facet_combos(cube, selected)}").fetchall()
+    want = df[_mask(df, selected)].groupby(["sk1", "sk2", "sk3"]).size()
+    assert {(a, b, c): n for a, b, c, n in got} == {k: int(v) for k, v in want.items()}
+
+
+def test_filter_hits_keeps_order(con, union, frame):
+    df, _ = frame
+    selected = {"sk1": ["故"]}
+    hits = df[ROWID].tolist()[::-97]  # 任意順序的命中清單
+    got = filter_hits(con, union.scan, hits, selected)
+    allowed = set(df[_mask(df, selected)][ROWID])
+    assert got == [h for h in hits if h in allowed]
+    assert filter_hits(con, union.scan, [], selected) == []
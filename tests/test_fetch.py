@@ -0,0 +1,64 @@
+"""muz.fetch：以本機 HTTP 替身驗證單次下載、ETag 條件請求與上游錯誤時沿用快取。"""
+import threading
+
+import pytest
+
+from muz.fetch import fetch
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_concurrent_requests_share_one_download(upstream):
+    url = upstream.add("/concurrent.csv", b"a,b\n1,2\n", etag='"v1"', delay=0.3)
+    results, errors = [], []
+
+    def worker():
+        try:
+            results.append(fetch(url))
+        except Exception as e:  # pragma: no cover - 失敗時留給下面的斷言
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert not errors
+    assert len(results) == 8 and len(set(results)) == 1
+    assert len(upstream.gets("/concurrent.csv")) == 1
+    assert _read(results[0]) == b"a,b\n1,2\n"
+
+
+def test_etag_revalidation_gets_304(upstream):
+    url = upstream.add("/etag.csv", b"x\n1\n", etag='"abc"')
+    first = fetch(url, revalidate_after=0)
+    second = fetch(url, revalidate_after=0)
+    gets = upstream.gets("/etag.csv")
+    assert [g[2] for g in gets] == [200, 304]
+    assert gets[1][3].get("If-None-Match") == '"abc"'
+    assert first == second and _read(second) == b"x\n1\n"
+
+
+def test_within_revalidate_window_skips_network(upstream):
+    url = upstream.add("/fresh.csv", b"x\n1\n", etag='"f"')
+    fetch(url)
+    fetch(url, revalidate_after=3600)
+    assert len(upstream.gets("/fresh.csv")) == 1
+
+
+def test_upstream_error_serves_cached_copy(upstream):
+    url = upstream.add("/flaky.csv", b"x\nold\n", etag='"1"')
+    path = fetch(url, revalidate_after=0)
+    upstream.routes["/flaky.csv"]["status"] = 500
+    assert fetch(url, revalidate_after=0) == path
+    assert _read(path) == b"x\nold\n"
+    assert [g[2] for g in upstream.gets("/flaky.csv")] == [200, 500]
+
+
+def test_error_without_cached_copy_raises(upstream):
+    url = upstream.add("/missing.csv", b"", status=503)
+    with pytest.raises(Exception):
+        fetch(url)
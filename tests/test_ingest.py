@@ -0,0 +1,12 @@
+"""muz.ingest：遠端來源的快取 key 只依 ETag / Last-Modified。"""
+from muz.ingest import source_key
+
+
+def test_remote_without_validator_is_not_cached(upstream):
+    url = upstream.add("/novalidator.csv", b"a\n1\n")
+    assert source_key(url) is None
+
+
+def test_remote_key_follows_etag(upstream):
+    url = upstream.add("/etag_key.csv", b"a\n1\n", etag='"v1"')
+    assert source_key(url) is not None
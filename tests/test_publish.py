@@ -0,0 +1,87 @@
+"""muz.publish / published_scan：發佈的 Parquet 依 sk 排序、帶 __rowid，App 可直接查詢（本機與 HTTP 替身）。"""
+import json
+import os
+
+import duckdb
+import pytest
+
+from muz.db import ConnectionManager
+from muz.diskcache import sql_literal
+from muz.ingest import ROWID, ingest, published_scan
+from muz.publish import MANIFEST, publish
+
+SK1 = ["故", "購", "贈", "中"]
+SK2 = ["銅", "玉", "瓷"]
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "d99測_s1.csv"
+    lines = ["name,id,sk1,sk2,sk3"]
+    for i in range(6000):
+        lines.append(f"品{i},id{i:05d},{SK1[i * 7 % 4]},{SK2[i * 5 % 3]},類{i % 2}")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def published(tmp_path, csv_path):
+    out = str(tmp_path / "parquet")
+    manifest = publish([csv_path], out)
+    return os.path.join(out, "d99測_s1.parquet"), manifest, out
+
+
+def test_published_file_is_sorted_with_rowid(published):
+    path, manifest, _ = published
+    con = duckdb.connect()
+    rows = con.execute(f'SELECT sk1, sk2, "{ROWID}" FROM read_parquet({sql_literal(path)}) ORDER BY "{ROWID}"').fetchall()
+    assert [r[2] for r in rows] == list(range(6000))
+    assert [(r[0], r[1]) for r in rows] == sorted((r[0], r[1]) for r in rows)
+    ent = manifest["files"]["d99測_s1.csv"]
+    assert ent["rows"] == 6000 and ent["sort_by"] == ["sk1", "sk2"]
+    assert len(ent["row_groups"]) == 3 and all("sk1" in g for g in ent["row_groups"])
+
+
+def test_republish_skips_unchanged_source(published, csv_path, capsys):
+    path, manifest, out = published
+    mtime = os.stat(path).st_mtime_ns
+    publish([csv_path], out)
+    assert "unchanged" in capsys.readouterr().out
+    assert os.stat(path).st_mtime_ns == mtime
+    with open(os.path.join(out, MANIFEST), encoding="utf-8") as f:
+        assert json.load(f)["files"]["d99測_s1.csv"]["sha1"] == manifest["files"]["d99測_s1.csv"]["sha1"]
+
+
+def test_published_scan_local(published, csv_path, tmp_path):
+    path, _, _ = published
+    con = duckdb.connect()
+    scan = published_scan(con, path)
+    assert scan is not None
+    assert con.execute(f"SELECT count(*) FROM {scan} WHERE sk1 = '故'").fetchone()[0] == 1500
+    assert published_scan(con, csv_path) is None
+    plain = str(tmp_path / "plain.parquet")
+    con.execute(f"COPY (SELECT 1 AS a) TO {sql_literal(plain)} (FORMAT PARQUET)")
+    assert published_scan(con, plain) is None
+
+
+def test_ingest_keeps_published_rowid(published):
+    path, _, _ = published
+    con = duckdb.connect()
+    ing = ingest(con, path, f"read_parquet({sql_literal(path)})")
+    src = con.execute(f'SELECT id, "{ROWID}" FROM read_parquet({sql_literal(path)}) ORDER BY 2').fetchall()
+    assert con.execute(f'SELECT id, "{ROWID}" FROM {ing.scan} ORDER BY 2').fetchall() == src
+
+
+def test_published_scan_remote_uses_range_requests(published, upstream):
+    path, _, _ = published
+    db = ConnectionManager()
+    if not db.ensure_httpfs():
+        pytest.skip(f"httpfs 無法載入：{db.httpfs_error}")
+    with open(path, "rb") as f:
+        url = upstream.add("/d99.parquet", f.read())
+    con = db.cursor()
+    scan = published_scan(con, url)
+    assert scan is not None
+    assert con.execute(f"SELECT count(*) FROM {scan}").fetchone()[0] == 6000
+    gets = upstream.gets("/d99.parquet")
+    assert gets and all("Range" in g[3] for g in gets)
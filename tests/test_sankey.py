@@ -0,0 +1,78 @@
+"""muz.sankey：節點不多時縮減圖與舊版 pandas Sankey 完全一致；節點過多時併成「其他」且總權重不變。"""
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import BUNDLED
+from muz.ingest import ingest_union
+from muz.sankey import other_label, reduce_graph, sk1_totals
+from muz.sk import MISSING, SK_COLS, combos_source
+
+
+def _baseline(con, scan):
+    """舊版 streamlit_app.py 的 Sankey：整份 sk 欄讀進 pandas 後 groupby；連線以標籤表示。"""
+    work = con.execute(f'SELECT "sk1", "sk2", "sk3" FROM {scan}').fetchdf().fillna(MISSING)
+    links = set()
+    for a, b in [("sk1", "sk2"), ("sk2", "sk3")]:
+        g = work.groupby([a, b], dropna=False, as_index=False).size()
+        links |= {(s, d, int(v)) for s, d, v in g.itertuples(index=False)}
+    labels = pd.unique(pd.concat([work["sk1"], work["sk2"], work["sk3"]], ignore_index=True)).tolist()
+    return links, labels
+
+
+def _named(links, labels) -> set:
+    return {(labels[s], labels[d], int(v)) for s, d, v in links[["src", "dst", "value"]].itertuples(index=False)}
+
+
+@pytest.fixture(scope="module")
+def union(con, bundled):
+    return ingest_union(con, BUNDLED)
+
+
+@pytest.mark.parametrize("name", [os.path.basename(p) for p in BUNDLED])
+def test_matches_pandas_baseline(con, bundled, name):
+    ing = bundled[name]
+    links, labels = reduce_graph(con, combos_source(con, ing, ing.scan))
+    want_links, want_labels = _baseline(con, ing.scan)
+    assert labels == want_labels
+    assert _named(links, labels) == want_links
+
+
+def test_union_small_levels_kept(con, union):
+    links, labels = reduce_graph(con, combos_source(con, union, union.scan), top_n=30)
+    want_links, want_labels = _baseline(con, union.scan)
+    assert labels == want_labels
+    assert _named(links, labels) == want_links
+    assert not any(other_label(c) in labels for c in SK_COLS)
+
+
+def test_missing_values_without_cache(con):
+    scan = "(SELECT * FROM (VALUES ('故', NULL, '法帖'), ('故', '帖', '法帖'), (NULL, '帖', NULL)) t(sk1, sk2, sk3))"
+    links, labels = reduce_graph(con, combos_source(con, None, scan))
+    want_links, want_labels = _baseline(con, scan)
+    # 未匯入的來源沒有列號，同層節點順序不保證，只比集合
+    assert set(labels) == set(want_labels) and MISSING in labels
+    assert _named(links, labels) == want_links
+
+
+@pytest.mark.parametrize("top_n", [1, 2, 3])
+def test_top_n_folds_into_other(con, union, top_n):
+    combos = combos_source(con, union, union.scan)
+    rows = con.execute(f"SELECT count(*) FROM {union.scan}").fetchone()[0]
+    distinct = con.execute(f"SELECT {', '.join(f'count(DISTINCT {c})' for c in SK_COLS)} FROM {combos}").fetchone()
+    links, labels = reduce_graph(con, combos, top_n=top_n, share=1.0)
+    # 兩層連線（sk1→sk2、sk2→sk3）各自的總權重都等於資料列數
+    assert int(links["value"].sum()) == 2 * rows
+    for c, n in zip(SK_COLS, distinct):
+        assert (other_label(c) in labels) == (n > top_n), c
+    # 每層最多 top_n 個真實節點 + 1 個「其他」
+    assert len(labels) <= 3 * (top_n + 1)
+
+
+def test_sk1_drill_down(con, union):
+    combos = combos_source(con, union, union.scan)
+    sk1, weight = sk1_totals(con, combos)[0]
+    links, labels = reduce_graph(con, combos, sk1=sk1)
+    assert int(links["value"].sum()) == 2 * weight
+    assert labels[0] == sk1
@@ -0,0 +1,43 @@
+"""muz.search：bigram 索引搜尋與 ILIKE 掃描命中同一批列，並依命中欄位數排序。"""
+import pytest
+
+from muz.ingest import ROWID
+from muz.search import ensure_index, has_index, search
+from conftest import BUNDLED
+
+KEYWORDS = ["龍", "山水", "公分", "王羲之", "清乾隆", "帖", "A", "jpg"]
+
+
+def _columns(con, ing) -> list:
+    return [r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {ing.scan}").fetchall() if r[0] != ROWID]
+
+
+def _ilike_hits(con, ing, kw: str, cols: list) -> dict:
+    """ILIKE 掃描：{__rowid: 命中欄位數}。"""
+    n_cols = " + ".join(f'coalesce(CAST("{c}" AS TEXT) ILIKE $kw, false)::INTEGER' for c in cols)
+    rows = con.execute(
+        f'SELECT "{ROWID}", {n_cols} AS n FROM {ing.scan} WHERE n > 0', {"kw": f"%{kw}%"}
+    ).fetchall()
+    return dict(rows)
+
+
+@pytest.mark.parametrize("name", [p.rsplit("/", 1)[-1] for p in BUNDLED])
+def test_index_matches_ilike(con, bundled, name):
+    ing = bundled[name]
+    ensure_index(con, ing)
+    assert has_index(ing)
+    cols = _columns(con, ing)
+    for kw in KEYWORDS:
+        hits = search(con, ing, kw, cols)
+        want = _ilike_hits(con, ing, kw, cols)
+        assert len(hits) == len(set(hits)), kw
+        assert set(hits) == set(want), (name, kw)
+        # 命中欄位數多的排前面
+        n = [want[h] for h in hits]
+        assert n == sorted(n, reverse=True), (name, kw)
+
+
+def test_search_respects_column_subset(con, bundled):
+    ing = bundled["d22帖_s1.csv"]
+    ensure_index(con, ing)
+    assert set(search(con, ing, "帖", ["sk2"])) == set(_ilike_hits(con, ing, "帖", ["sk2"]))
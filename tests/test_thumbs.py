@@ -0,0 +1,58 @@
+"""muz.thumbs：以本機 HTTP 替身驗證不等待、單次下載、縮圖靜態網址與失敗後不重試。"""
+import io
+import os
+import threading
+
+import pytest
+
+from muz import thumbs
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _png(w: int = 400, h: int = 300) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (w, h), (200, 30, 30)).save(out, format="PNG")
+    return out.getvalue()
+
+
+def _local_path(thumb_url: str) -> str:
+    assert thumb_url.startswith(thumbs.URL_PREFIX)
+    return os.path.join(thumbs.STORE.root, thumb_url[len(thumbs.URL_PREFIX):])
+
+
+def test_miss_returns_original_without_waiting(upstream):
+    url = upstream.add("/slow.png", _png(), delay=0.5, ctype="image/png")
+    assert thumbs.serve([url]) == [url]
+    path = thumbs.submit(url).result(timeout=10)
+    served = thumbs.serve([url, None, ""])
+    assert served[1:] == [None, ""]
+    with Image.open(_local_path(served[0])) as im:
+        assert im.format == "JPEG" and max(im.size) <= thumbs.THUMB_PX
+    assert _local_path(served[0]) == path
+
+
+def test_concurrent_sessions_download_once(upstream):
+    url = upstream.add("/shared.png", _png(), delay=0.3, ctype="image/png")
+    threads = [threading.Thread(target=thumbs.serve, args=([url],), kwargs={"wait_sec": 2}) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert len(upstream.gets("/shared.png")) == 1
+    assert thumbs.serve([url])[0].startswith(thumbs.URL_PREFIX)
+
+
+def test_failed_url_is_not_retried(upstream):
+    url = upstream.add("/broken.png", b"", status=500)
+    assert thumbs.submit(url).result(timeout=10) is None
+    assert thumbs.serve([url], wait_sec=1) == [url]
+    assert len(upstream.gets("/broken.png")) == 1
+
+
+def test_prefetch_later_loads_urls_in_background(upstream):
+    urls = [upstream.add(f"/next{i}.png", _png(), ctype="image/png") for i in range(3)]
+    thumbs.prefetch_later(lambda: urls + [None]).result(timeout=10)
+    for u in urls:
+        assert thumbs.submit(u).result(timeout=10)
+    assert all(len(upstream.gets(f"/next{i}.png")) == 1 for i in range(3))